@@ -24,9 +24,12 @@ function ChartsSection({ plantId }) {
 
     const fetchHistory = async () => {
       try {
-        const res = await axios.get(`${API_BASE_URL}/plants/${plantId}/history`);
+        // Lectures les plus récentes (sans start, l'API part de la dernière clé)
+        const res = await axios.get(`${API_BASE_URL}/plants/${plantId}/history`, {
+          params: { limit: 2000 },
+        });
 
-        const cleaned = (res.data || []).map((h) => ({
+        const cleaned = (res.data?.readings || []).map((h) => ({
           humidity: h.humidity ?? 0,
           temperature: h.temperature ?? 0,
           light: h.lightLevel ?? h.light ?? 0,
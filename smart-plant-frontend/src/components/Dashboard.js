@@ -67,9 +67,10 @@ useEffect(() => {
   };
   loadPlant();
 
-  // Optionnel : refresh toutes les X secondes pour simuler temps réel
-  const interval = setInterval(loadPlant, 5000);
-  return () => clearInterval(interval);
+  // Temps réel : l'API pousse chaque lecture (Server-Sent Events) au lieu d'un polling toutes les 5 s
+  const source = new EventSource(`${API_BASE_URL}/plants/${selectedPlant}/stream`);
+  source.addEventListener("reading", (event) => setPlantData(JSON.parse(event.data)));
+  return () => source.close();
 
 }, [selectedPlant]);
 
@@ -14,11 +14,12 @@ export default function PlantHistoryGrid({ selectedPlant }) {
     const loadHistory = async () => {
       setLoading(true);
       try {
+        // Lectures les plus récentes (sans start, l'API part de la dernière clé)
         const res = await axios.get(
-          `http://127.0.0.1:5000/plants/${selectedPlant}/history`
+          `http://127.0.0.1:5000/plants/${selectedPlant}/history`,
+          { params: { limit: 5000 } }
         );
-
-        const history = res.data || [];
+        const history = res.data?.readings || [];
 
         const formatted = history.map((h, index) => ({
           id: index,
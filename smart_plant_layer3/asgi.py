@@ -0,0 +1,305 @@
+"""
+Variante ASGI de l'API de la couche 3 : mêmes handlers que les routes Flask
+d'APIService, servis par une boucle d'événements.
+
+Les appels bloquants (Firebase, SQLite, Cloud Storage) passent par un
+ThreadPoolExecutor borné ; un sémaphore limite les requêtes en attente et
+répond 503 au-delà de ASGI_QUEUE_TIMEOUT au lieu d'empiler sans fin.
+Le flux SSE (réveillé par l'ingest via call_soon_threadsafe, sans sondage)
+et l'export NDJSON sont servis sans bloquer la boucle.
+
+Usage :
+    uvicorn asgi:create_asgi_app --factory --host 0.0.0.0 --port 5000 [--workers 4]
+    python asgi.py
+(plusieurs workers : LEADER_ELECTION=file|firebase => un seul ingest, voir main.py)
+"""
+import asyncio
+import json
+import os
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from prometheus_client import Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+from main import STREAM_HEARTBEAT, create_services
+
+ASGI_EXECUTOR_WORKERS = int(os.environ.get("ASGI_EXECUTOR_WORKERS", 64))  # appels bloquants simultanés
+ASGI_MAX_PENDING = int(os.environ.get("ASGI_MAX_PENDING", 512))  # appels bloquants en cours + en attente
+ASGI_QUEUE_TIMEOUT = float(os.environ.get("ASGI_QUEUE_TIMEOUT", 5))  # secondes avant 503
+ASGI_MAX_BODY = int(os.environ.get("ASGI_MAX_BODY", 64 * 1024))  # octets
+
+ASGI_REQUEST_SECONDS = Histogram(
+    "asgi_request_seconds", "Durée des requêtes servies par l'API ASGI", ["route", "status"]
+)
+ASGI_EXECUTOR_WAIT_SECONDS = Histogram(
+    "asgi_executor_wait_seconds", "Attente d'une place pour un appel bloquant (Firebase, SQLite)"
+)
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+]
+
+
+class Overloaded(Exception):
+    pass
+
+
+def header(scope, name):
+    value = dict(scope["headers"]).get(name)
+    return value.decode("latin-1") if value is not None else None
+
+
+class AsgiAPI:
+    def __init__(self, api_service, max_workers=ASGI_EXECUTOR_WORKERS, max_pending=ASGI_MAX_PENDING,
+                 queue_timeout=ASGI_QUEUE_TIMEOUT):
+        self.api = api_service
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asgi-io")
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._semaphore = None  # créé dans la boucle d'événements du worker
+        self.routes = [
+            ("GET", re.compile(r"^/$"), "home", self.home),
+            ("GET", re.compile(r"^/plants/([^/]+)/state$"), "state", self.state),
+            ("GET", re.compile(r"^/plants/([^/]+)/stream$"), "stream", self.stream),
+            ("GET", re.compile(r"^/plants/([^/]+)/history$"), "history", self.history),
+            ("GET", re.compile(r"^/plants/([^/]+)/rollups$"), "rollups", self.rollups),
+            ("POST", re.compile(r"^/plants/([^/]+)/command$"), "command", self.command),
+            ("GET", re.compile(r"^/admin/all-data$"), "all_data", self.all_data),
+            ("GET", re.compile(r"^/cdn/([^/]+)/files$"), "cdn_files", self.cdn_files),
+            ("GET", re.compile(r"^/admin/profile$"), "profile", self.profile),
+            ("GET", re.compile(r"^/admin/tracemalloc$"), "tracemalloc", self.tracemalloc),
+            ("GET", re.compile(r"^/metrics$"), "metrics", self.metrics),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        started = time.perf_counter()
+        route, status = "unknown", 500
+        try:
+            route, status = await self.dispatch(scope, receive, send)
+        except Overloaded:
+            status = await self.send_json(send, {"error": "Serveur saturé, réessayez"}, 503)
+        except Exception as e:
+            print(f"[ASGI] Erreur {scope['method']} {scope['path']}: {e}")
+            status = await self.send_json(send, {"error": "Erreur interne"}, 500)
+        finally:
+            ASGI_REQUEST_SECONDS.labels(route=route, status=str(status)).observe(time.perf_counter() - started)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def dispatch(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+        path_matched = False
+        for route_method, pattern, name, handler in self.routes:
+            match = pattern.match(path)
+            if match is None:
+                continue
+            path_matched = True
+            if method == "OPTIONS":
+                return name, await self.preflight(scope, send)
+            if method == route_method or (method == "HEAD" and route_method == "GET"):
+                args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+                return name, await handler(scope, send, receive, args, *match.groups())
+        if path_matched:
+            return "unknown", await self.send_json(send, {"error": "Méthode non autorisée"}, 405)
+        return "unknown", await self.send_json(send, {"error": "Route inconnue"}, 404)
+
+    # ---- I/O ----
+    async def run_blocking(self, fn, *args):
+        # place bornée dans l'exécuteur : au-delà de queue_timeout d'attente -> 503
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        waited = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded()
+        ASGI_EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - waited)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._semaphore.release()
+
+    async def send_json(self, send, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())] + CORS_HEADERS})
+        await send({"type": "http.response.body", "body": body})
+        return status
+
+    async def send_result(self, send, result):
+        payload, status = result
+        return await self.send_json(send, payload, status)
+
+    async def send_text(self, send, text, status=200):
+        body = text.encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                                (b"content-length", str(len(body)).encode())] + CORS_HEADERS})
+        await send({"type": "http.response.body", "body": body})
+        return status
+
+    async def preflight(self, scope, send):
+        requested = dict(scope["headers"]).get(b"access-control-request-headers", b"content-type")
+        await send({"type": "http.response.start", "status": 204,
+                    "headers": CORS_HEADERS + [(b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+                                               (b"access-control-allow-headers", requested)]})
+        await send({"type": "http.response.body", "body": b""})
+        return 204
+
+    async def read_body(self, receive):
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            body += message.get("body", b"")
+            if len(body) > ASGI_MAX_BODY:
+                return None
+            if not message.get("more_body"):
+                return body
+
+    # ---- Routes ----
+    async def home(self, scope, send, receive, args):
+        return await self.send_json(send, {"message": "Smart Garden API running"})
+
+    async def state(self, scope, send, receive, args, plant_id):
+        state = self.api.cached_state(plant_id)
+        if state is not None:
+            return await self.send_json(send, state)
+        return await self.send_result(send, await self.run_blocking(self.api.get_state, plant_id))
+
+    async def history(self, scope, send, receive, args, plant_id):
+        return await self.send_result(send, await self.run_blocking(self.api.get_history, plant_id, args))
+
+    async def rollups(self, scope, send, receive, args, plant_id):
+        return await self.send_result(send, await self.run_blocking(self.api.get_rollups, plant_id, args))
+
+    async def command(self, scope, send, receive, args, plant_id):
+        body = await self.read_body(receive)
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        # dispatch() ne fait que mettre en file : pas besoin de l'exécuteur
+        return await self.send_result(send, self.api.send_command(plant_id, data))
+
+    async def cdn_files(self, scope, send, receive, args, user_id):
+        return await self.send_result(send, await self.run_blocking(self.api.list_files, user_id))
+
+    async def all_data(self, scope, send, receive, args):
+        if args.get("format") != "ndjson":
+            return await self.send_result(send, await self.run_blocking(self.api.get_all_data))
+        lines, headers = self.api.export_request(args)
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/x-ndjson")] + CORS_HEADERS
+                               + [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+        # chaque page est lue dans l'exécuteur, la boucle reste libre entre deux pages
+        while True:
+            chunk = await self.run_blocking(next, lines, None)
+            if chunk is None:
+                break
+            await send({"type": "http.response.body", "body": chunk if isinstance(chunk, bytes) else chunk.encode(),
+                        "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+        return 200
+
+    async def stream(self, scope, send, receive, args, plant_id):
+        broker = self.api.telemetry_broker
+        if broker is None:
+            return await self.send_json(send, {"error": "Flux temps réel désactivé"}, 503)
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        disconnected = False
+
+        def on_event():
+            # thread de l'ingest -> boucle d'événements
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # boucle fermée
+
+        async def watch_disconnect():
+            nonlocal disconnected
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected = True
+            wakeup.set()
+
+        subscription = broker.subscribe(plant_id)
+        subscription.on_event = on_event
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                                    (b"x-accel-buffering", b"no")] + CORS_HEADERS})
+            await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+            while not subscription.closed and not disconnected:
+                # effacer avant de vider la file : une publication pendant l'envoi réveille le tour suivant
+                wakeup.clear()
+                events = []
+                while True:
+                    try:
+                        events.append(subscription.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if events:
+                    body = "".join(f"event: reading\ndata: {data}\n\n" for data in events).encode()
+                    await send({"type": "http.response.body", "body": body, "more_body": True})
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            subscription.on_event = None
+            watcher.cancel()
+            broker.unsubscribe(subscription)
+        return 200
+
+    async def profile(self, scope, send, receive, args):
+        # le profilage occupe un thread de l'exécuteur pendant la fenêtre, pas la boucle
+        payload, status = await self.run_blocking(self.api.run_profile, args, header(scope, b"authorization"))
+        if isinstance(payload, str):
+            return await self.send_text(send, payload, status)
+        return await self.send_json(send, payload, status)
+
+    async def tracemalloc(self, scope, send, receive, args):
+        return await self.send_result(
+            send, await self.run_blocking(self.api.run_tracemalloc, args, header(scope, b"authorization"))
+        )
+
+    async def metrics(self, scope, send, receive, args):
+        body = generate_latest()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", CONTENT_TYPE_LATEST.encode())]})
+        await send({"type": "http.response.body", "body": body})
+        return 200
+
+
+def create_asgi_app():
+    return AsgiAPI(create_services())
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    print("🌐 API ASGI accessible sur http://localhost:5000")
+    uvicorn.run(create_asgi_app(), host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,184 @@
+"""
+Test de charge de l'API : serveur actuel (Flask/werkzeug threadé, comme app.run)
+vs variante ASGI (asgi.py sous uvicorn), mêmes handlers et mêmes faux composants
+que bench_ingest (latence Firebase injectée, pas de cache d'état par défaut).
+
+C clients concurrents (processus séparé) enchaînent /state, /history et /command pendant D secondes ;
+débit, p50/p99 par route et erreurs écrits en JSON (--output).
+
+Usage :
+    python bench_api.py --concurrency 200 --duration 10 --db-latency 0.05
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+
+import uvicorn
+from werkzeug.serving import make_server
+
+from asgi import AsgiAPI
+from bench_ingest import FakeDatabaseManager, FakeNotificationService, LoopbackCommunicator, summarize
+from main import APIService, CommandDispatcher, LatestStateCache, timestamp_key
+
+
+def build_api(args):
+    db_manager = FakeDatabaseManager(args.db_latency)
+    device_ids = [f"bench_{i:05d}" for i in range(args.devices)]
+    base_ms = int(time.time() * 1000)
+    db_manager._record([
+        (device_id, {"deviceId": device_id, "soilMoisture": 50.0, "temperature": 22.0, "lightLevel": 500.0,
+                     "humidity": 60.0, "timestamp": timestamp_key(base_ms - k * 60000), "emotion": "neutre"})
+        for device_id in device_ids for k in range(200)
+    ])
+    communicator = LoopbackCommunicator()
+    dispatcher = CommandDispatcher(communicator, db_manager, FakeNotificationService())
+    dispatcher.start()
+    state_cache = LatestStateCache() if args.state_cache else None
+    api = APIService(communicator, db_manager, None, dispatcher, state_cache=state_cache)
+    return api, device_ids
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve_flask(api):
+    server = make_server("127.0.0.1", 0, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield "127.0.0.1", server.server_port
+    finally:
+        server.shutdown()
+
+
+@contextlib.contextmanager
+def serve_asgi(api):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(AsgiAPI(api), host="127.0.0.1", port=port, log_level="warning",
+                                           backlog=4096))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        yield "127.0.0.1", port
+    finally:
+        server.should_exit = True
+        thread.join(10)
+
+
+def load(host, port, device_ids, concurrency, duration):
+    # un thread + une connexion keep-alive par client (http.client : client léger, neutre vis-à-vis du serveur)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    command_body = json.dumps({"command": "SET_LED_COLOR:GREEN"})
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        while time.perf_counter() < deadline:
+            device_id = random.choice(device_ids)
+            route = random.choice(("state", "history", "command"))
+            t0 = time.perf_counter()
+            try:
+                if route == "command":
+                    connection.request("POST", f"/plants/{device_id}/command", command_body,
+                                       {"Content-Type": "application/json"})
+                elif route == "history":
+                    connection.request("GET", f"/plants/{device_id}/history?limit=50")
+                else:
+                    connection.request("GET", f"/plants/{device_id}/state")
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                with lock:
+                    errors[route] += 1
+                continue
+            elapsed = time.perf_counter() - t0
+            with lock:
+                if response.status != 200:
+                    errors[f"{route}_{response.status}"] += 1
+                else:
+                    latencies[route].append(elapsed)
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "requests": total,
+        "throughput_req_per_s": round(total / elapsed, 1),
+        "routes": {route: summarize(values) for route, values in latencies.items()},
+        "errors": dict(errors),
+    }
+
+
+def run(args):
+    results = {
+        "benchmark": "layer3_api",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "devices": args.devices, "concurrency": args.concurrency, "duration_s": args.duration,
+            "db_latency_s": args.db_latency, "state_cache": args.state_cache,
+        },
+    }
+    # le client tourne dans un processus séparé pour ne pas disputer le GIL au serveur mesuré ;
+    # un seul APIService (les métriques Prometheus de Flask ne s'enregistrent qu'une fois par processus)
+    api, device_ids = build_api(args)
+    with multiprocessing.get_context("spawn").Pool(1) as client:
+        for name, serve in (("flask_threaded", serve_flask), ("asgi_uvicorn", serve_asgi)):
+            api.db_manager.calls.clear()
+            with serve(api) as (host, port):
+                results[name] = client.apply(load, (host, port, device_ids, args.concurrency, args.duration))
+            results[name]["firebase_calls"] = dict(api.db_manager.calls)
+    api.command_dispatcher.stop()
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Test de charge API Flask vs ASGI de la couche 3")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=100, help="clients simultanés")
+    parser.add_argument("--duration", type=float, default=10.0, help="secondes par serveur")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="latence simulée d'un appel Firebase (s)")
+    parser.add_argument("--state-cache", action="store_true", help="activer le cache d'état (moins d'appels Firebase)")
+    parser.add_argument("--output", default="bench_api_results.json")
+    parser.add_argument("--verbose", action="store_true", help="garder les logs du service")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    if args.verbose:
+        results = run(args)
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"💾 Résultats enregistrés dans {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
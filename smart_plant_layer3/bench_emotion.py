@@ -0,0 +1,47 @@
+"""
+Benchmark : règles scalaires (une SensorData à la fois) vs API vectorisée
+EmotionEngine.determine_emotions / DecisionMaker.decide_actions.
+
+Usage : python bench_emotion.py [nombre_de_lectures]
+"""
+import sys
+import time
+
+import numpy as np
+
+from main import SensorData, EmotionEngine, DecisionMaker
+
+
+def main(n=200_000):
+    rng = np.random.default_rng(42)
+    soil = rng.uniform(0, 100, n)
+    temp = rng.uniform(0, 50, n)
+    light = rng.uniform(0, 100, n)
+    readings = [
+        SensorData("bench", s, t, l, 50.0, timestamp=0)
+        for s, t, l in zip(soil.tolist(), temp.tolist(), light.tolist())
+    ]
+    engine, decider = EmotionEngine(), DecisionMaker()
+
+    t0 = time.perf_counter()
+    scalar_emotions = [engine.determine_emotion(r) for r in readings]
+    scalar_actions = [decider.decide_action(e) for e in scalar_emotions]
+    scalar_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    codes = engine.determine_emotions(soil, temp, light)
+    actions = decider.decide_actions(codes)
+    batch_s = time.perf_counter() - t0
+
+    # même résultat que les règles scalaires
+    assert [EmotionEngine.EMOTIONS[c] for c in codes] == scalar_emotions
+    assert [DecisionMaker.ACTIONS[a] if a != DecisionMaker.NO_ACTION else None for a in actions] == scalar_actions
+
+    print(f"📊 {n} lectures")
+    print(f"   Scalaire : {scalar_s:.3f}s ({n / scalar_s:,.0f} lectures/s)")
+    print(f"   Vectorisé: {batch_s:.4f}s ({n / batch_s:,.0f} lectures/s)")
+    print(f"   Gain     : x{scalar_s / batch_s:.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
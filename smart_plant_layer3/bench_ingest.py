@@ -0,0 +1,351 @@
+"""
+Benchmark de bout en bout de la couche 3 (DataIngestService + APIService),
+sans HiveMQ Cloud ni Firebase de production.
+
+- MQTT : boucle locale en mémoire (par défaut) ou broker local (--broker localhost:1883, ex. mosquitto)
+- Firebase / notifications : faux DatabaseManager / NotificationService avec latence injectée
+- N plantes simulées à M messages/s chacune, requêtes concurrentes sur /state et /history
+
+Résultats (messages/s, p50/p99 ingest, p50/p99 API) écrits en JSON (--output).
+
+Usage :
+    python bench_ingest.py --devices 200 --rate 0.5 --duration 20 --db-latency 0.05
+    python bench_ingest.py --broker localhost:1883 --output bench_ingest_results.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+import requests
+from werkzeug.serving import make_server
+
+import main
+from main import (DatabaseManager, NotificationService, MqttCommunicator, EmotionEngine, DecisionMaker,
+                  ReadingWriteBuffer, LatestStateCache, CommandDispatcher, DataIngestService, APIService,
+                  LocalReadingStore, HISTORY_DEFAULT_LIMIT, timestamp_key)
+
+
+# ==========================
+# Faux composants (latence injectée)
+# ==========================
+class FakeDatabaseManager(DatabaseManager):
+    def __init__(self, latency=0.0):
+        # pas de Firebase : tout est gardé en mémoire + miroir local SQLite
+        self.latency = latency
+        self.local_store = LocalReadingStore(":memory:")
+        self.local_reads = True
+        self.bucket = None
+        self.last_updates = {}
+        self.commands = defaultdict(list)
+        self.calls = defaultdict(int)
+        self.saved_at = {}  # (device_id, timestamp) -> perf_counter() à l'écriture
+        self.actuation = {}  # (device_id, actionneur) -> état partagé (transactions Firebase)
+        self._lock = threading.Lock()
+
+    def _firebase_call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _record(self, rows):
+        now = time.perf_counter()
+        with self._lock:
+            for device_id, data_dict in rows:
+                self.saved_at[(device_id, data_dict["timestamp"])] = now
+                previous = self.last_updates.get(device_id)
+                if previous is None or data_dict["timestamp"] >= previous["timestamp"]:
+                    self.last_updates[device_id] = data_dict
+        self._mirror(rows)
+
+    def save_reading(self, device_id, data_dict):
+        self._firebase_call("save_reading")
+        self._firebase_call("save_reading")  # readings/<ts> puis last_update
+        self._record([(device_id, data_dict)])
+        return True
+
+    def save_readings_batch(self, batch):
+        self._firebase_call("update")
+        self._record(batch)
+        return True
+
+    def save_command(self, device_id, command):
+        self._firebase_call("save_command")  # commands/<ts> + last_command en un update
+        with self._lock:
+            self.commands[device_id].append(command)
+        return True
+
+    def update_actuation(self, device_id, actuator, update_fn):
+        self._firebase_call("transaction")
+        with self._lock:
+            value = update_fn(self.actuation.get((device_id, actuator)))
+            self.actuation[(device_id, actuator)] = value
+            return value
+
+    def get_latest_state(self, plant_id):
+        self._firebase_call("get_latest_state")
+        with self._lock:
+            return self.last_updates.get(plant_id)
+
+    def get_readings(self, plant_id, start=None, end=None, limit=HISTORY_DEFAULT_LIMIT, after=None):
+        if start is None and after is None:
+            # lectures les plus récentes : chemin réel (base locale, sinon _query_latest)
+            return DatabaseManager.get_readings(self, plant_id, start, end, limit, after)
+        lower = max(start, after) if start is not None and after is not None else (after or start)
+        if not self.local_store.covers(plant_id, lower):
+            # ce que Firebase aurait servi : même contenu, avec la latence réseau
+            self._firebase_call("get_readings")
+        readings = self.local_store.query(plant_id, start, end, limit + 1, after=after)
+        page = readings[:limit]
+        return page, (page[-1]["timestamp"] if len(readings) > limit else None)
+
+    def _query_latest(self, plant_id, end, limit):
+        self._firebase_call("get_readings")
+        return [(r["timestamp"], r) for r in self.local_store.query(plant_id, None, end)[-limit:]]
+
+    def list_plant_ids(self):
+        self._firebase_call("list_plant_ids")
+        with self._lock:
+            return sorted(self.last_updates)
+
+
+class FakeNotificationService(NotificationService):
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.count = 0
+
+    def push(self, plant_id, message, coalesce=True):
+        if self.latency:
+            time.sleep(self.latency)
+        self.count += 1
+
+
+class LoopbackCommunicator(MqttCommunicator):
+    # remplace le broker : publish() appelle directement le callback, comme le thread réseau paho
+    def __init__(self):
+        self.on_message = None
+        self.published_commands = 0
+
+    def set_on_message_callback(self, callback):
+        self.on_message = callback
+
+    def connect(self):
+        pass
+
+    def start_listening(self):
+        pass
+
+    def publish(self, topic, payload):
+        self.on_message(None, None, SimpleNamespace(topic=topic, payload=payload))
+
+    def publish_command(self, device_id, command):
+        self.published_commands += 1
+
+
+class LocalBrokerCommunicator(MqttCommunicator):
+    # vrai client paho vers un broker local, plus un second client pour publier la télémétrie
+    def __init__(self, host, port):
+        super().__init__(host, port)
+        self.publisher = mqtt.Client()
+        self.published_commands = 0
+
+    def connect(self):
+        super().connect()
+        self.publisher.connect(self.broker, self.port, 60)
+        self.publisher.loop_start()
+
+    def publish(self, topic, payload):
+        self.publisher.publish(topic, payload)
+
+    def publish_command(self, device_id, command):
+        super().publish_command(device_id, command)
+        self.published_commands += 1
+
+    def disconnect(self):
+        self.publisher.loop_stop()
+        self.client.loop_stop()
+
+
+# ==========================
+# Mesures
+# ==========================
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies_s):
+    return {
+        "count": len(latencies_s),
+        "p50_ms": round(percentile(latencies_s, 50) * 1000, 3) if latencies_s else None,
+        "p99_ms": round(percentile(latencies_s, 99) * 1000, 3) if latencies_s else None,
+    }
+
+
+def drive_devices(communicator, devices, rate, duration, sent_at):
+    # chaque plante publie `rate` messages/s pendant `duration` secondes
+    base_ms = int(time.time() * 1000)
+    interval = 1.0 / rate
+    device_ids = [f"bench_{i:05d}" for i in range(devices)]
+    start = time.perf_counter()
+    tick = 0
+    while True:
+        tick_time = start + tick * interval
+        if tick_time - start >= duration:
+            break
+        delay = tick_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for i, device_id in enumerate(device_ids):
+            ts_ms = base_ms + tick * 1000 * interval + i % 1000
+            payload = json.dumps({
+                "deviceId": device_id,
+                "soilMoisture": random.uniform(10, 90),
+                "temperature": random.uniform(10, 40),
+                "lightLevel": random.uniform(0, 100),
+                "humidity": random.uniform(20, 90),
+                "timestamp": int(ts_ms),
+            }).encode()
+            sent_at[(device_id, timestamp_key(int(ts_ms)))] = time.perf_counter()
+            communicator.publish(f"plant/{device_id}/telemetry", payload)
+        tick += 1
+    return device_ids, time.perf_counter() - start
+
+
+def hammer_api(base_url, device_ids, stop_event, latencies, clients):
+    def worker():
+        session = requests.Session()
+        while not stop_event.is_set():
+            device_id = random.choice(device_ids)
+            for route, url in (("state", f"{base_url}/plants/{device_id}/state"),
+                               ("history", f"{base_url}/plants/{device_id}/history?limit=100")):
+                t0 = time.perf_counter()
+                try:
+                    session.get(url, timeout=10)
+                except requests.RequestException:
+                    continue
+                latencies[route].append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run(args):
+    db_manager = FakeDatabaseManager(args.db_latency)
+    notif_service = FakeNotificationService(args.notif_latency)
+    if args.broker:
+        host, _, port = args.broker.partition(":")
+        communicator = LocalBrokerCommunicator(host, int(port or 1883))
+    else:
+        communicator = LoopbackCommunicator()
+
+    write_buffer = None
+    if not args.no_write_buffer:
+        write_buffer = ReadingWriteBuffer(db_manager)
+        write_buffer.start()
+    command_dispatcher = CommandDispatcher(communicator, db_manager, notif_service)
+    command_dispatcher.start()
+    state_cache = LatestStateCache()
+    ingest = DataIngestService(communicator, db_manager, EmotionEngine(), DecisionMaker(), notif_service,
+                               command_dispatcher, write_buffer=write_buffer, state_cache=state_cache,
+                               workers=args.workers)
+    api = APIService(communicator, db_manager, notif_service, command_dispatcher, state_cache=state_cache)
+    server = make_server("127.0.0.1", 0, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    communicator.connect()
+    if args.broker:
+        time.sleep(1)  # laisser le temps à la souscription
+
+    sent_at = {}
+    api_latencies = defaultdict(list)
+    stop_api = threading.Event()
+    device_ids = [f"bench_{i:05d}" for i in range(args.devices)]
+    api_threads = hammer_api(base_url, device_ids, stop_api, api_latencies, args.api_clients)
+
+    t0 = time.perf_counter()
+    _, drive_s = drive_devices(communicator, args.devices, args.rate, args.duration, sent_at)
+    # attendre que tout soit traité puis écrit
+    deadline = time.perf_counter() + args.drain_timeout
+    while len(db_manager.saved_at) < len(sent_at) and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    processed_s = time.perf_counter() - t0
+    stop_api.set()
+    for thread in api_threads:
+        thread.join(5)
+    if ingest.worker_pool is not None:
+        ingest.worker_pool.stop()
+    if write_buffer is not None:
+        write_buffer.stop()
+    command_dispatcher.stop()
+    server.shutdown()
+    if isinstance(communicator, LocalBrokerCommunicator):
+        communicator.disconnect()
+
+    ingest_latencies = [db_manager.saved_at[key] - sent for key, sent in sent_at.items()
+                        if key in db_manager.saved_at]
+    return {
+        "benchmark": "layer3_ingest",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "devices": args.devices, "rate_per_device": args.rate, "duration_s": args.duration,
+            "db_latency_s": args.db_latency, "notif_latency_s": args.notif_latency,
+            "workers": args.workers, "write_buffer": not args.no_write_buffer,
+            "broker": args.broker or "loopback", "api_clients": args.api_clients,
+        },
+        "ingest": {
+            "sent": len(sent_at),
+            "saved": len(ingest_latencies),
+            "send_rate_msgs_per_s": round(len(sent_at) / drive_s, 1),
+            "throughput_msgs_per_s": round(len(ingest_latencies) / processed_s, 1),
+            "latency": summarize(ingest_latencies),
+        },
+        "api": {route: summarize(values) for route, values in api_latencies.items()},
+        "firebase_calls": dict(db_manager.calls),
+        "commands_published": communicator.published_commands,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark ingest + API de la couche 3")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0.5, help="messages/s par plante")
+    parser.add_argument("--duration", type=float, default=10.0, help="secondes")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="latence simulée d'un appel Firebase (s)")
+    parser.add_argument("--notif-latency", type=float, default=0.05, help="latence simulée d'une notification (s)")
+    parser.add_argument("--workers", type=int, default=main.INGEST_WORKERS)
+    parser.add_argument("--no-write-buffer", action="store_true")
+    parser.add_argument("--broker", help="broker MQTT local host:port (défaut : boucle en mémoire)")
+    parser.add_argument("--api-clients", type=int, default=4)
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--output", default="bench_ingest_results.json")
+    parser.add_argument("--verbose", action="store_true", help="garder les logs du service")
+    args = parser.parse_args()
+
+    if args.verbose:
+        results = run(args)
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"💾 Résultats enregistrés dans {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
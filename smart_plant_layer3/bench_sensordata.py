@@ -0,0 +1,98 @@
+"""
+Micro-benchmark du décodage d'un message de télémétrie :
+ancien chemin (decode + json.loads + SensorData avec __dict__ + strftime + to_dict)
+vs SensorData.from_payload(...).to_record(emotion).
+
+Usage : python bench_sensordata.py [nombre_de_messages]
+"""
+import json
+import sys
+import time
+import gc
+from datetime import datetime
+
+from main import SensorData
+
+
+class LegacySensorData:
+    # copie de l'ancienne implémentation, pour comparaison
+    def __init__(self, deviceId, soilMoisture, temperature, lightLevel, humidity, timestamp=None, **kwargs):
+        self.device_id = deviceId
+        self.soil_moisture = float(soilMoisture)
+        self.temperature = float(temperature)
+        self.light_level = float(lightLevel)
+        self.humidity = float(humidity)
+        if timestamp is None:
+            ts = datetime.now()
+        else:
+            try:
+                ts = datetime.fromtimestamp(int(timestamp) / 1000)
+            except Exception:
+                ts = datetime.now()
+        self.timestamp = ts.strftime("%Y%m%d_%H%M%S_%f")
+
+    def to_dict(self):
+        return {
+            "deviceId": self.device_id,
+            "soilMoisture": self.soil_moisture,
+            "temperature": self.temperature,
+            "lightLevel": self.light_level,
+            "humidity": self.humidity,
+            "timestamp": self.timestamp
+        }
+
+
+def legacy_path(payload):
+    data = LegacySensorData(**json.loads(payload.decode())).to_dict()
+    data["emotion"] = "neutre"
+    return data
+
+
+def fast_path(payload):
+    return SensorData.from_payload(payload).to_record("neutre")
+
+
+def measure(fn, payloads, repeat=5):
+    # meilleur de `repeat` passes, GC désactivé pour limiter le bruit
+    best = float("inf")
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for p in payloads:
+                fn(p)
+            best = min(best, time.perf_counter() - t0)
+    finally:
+        gc.enable()
+    return best
+
+
+def object_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def main(n=100_000):
+    # 500 plantes qui publient toutes les 2 s (~250 messages par seconde)
+    base_ms = 1_760_000_000_000
+    payloads = [
+        json.dumps({"deviceId": f"Plant_{i % 500:04d}", "soilMoisture": 42, "temperature": 28.5,
+                    "lightLevel": 600, "humidity": 75, "timestamp": base_ms + i * 4 + i % 3}).encode()
+        for i in range(n)
+    ]
+    assert legacy_path(payloads[0]) == fast_path(payloads[0])
+
+    legacy_s = measure(legacy_path, payloads)
+    fast_s = measure(fast_path, payloads)
+    legacy_size = object_size(LegacySensorData(**json.loads(payloads[0])))
+    fast_size = object_size(SensorData.from_payload(payloads[0]))
+    print(f"📊 {n} messages")
+    print(f"   Ancien : {legacy_s / n * 1e6:.2f} µs/message ({legacy_size} octets par SensorData)")
+    print(f"   Nouveau: {fast_s / n * 1e6:.2f} µs/message ({fast_size} octets par SensorData)")
+    print(f"   Gain   : x{legacy_s / fast_s:.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
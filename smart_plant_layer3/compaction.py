@@ -0,0 +1,182 @@
+"""
+Rétention des lectures brutes (plants/<id>/readings).
+
+Les lectures plus anciennes que la rétention sont archivées en NDJSON gzip
+(un fichier par plante et par jour : <archive_dir>/<plant_id>/<YYYYMMDD>.ndjson.gz),
+puis supprimées de Firebase et de la base locale par lots bornés.
+Les agrégats (rollups) restent disponibles pour les graphes longue durée.
+
+Le job est reprenable : les clés d'un lot archivé mais pas encore supprimé sont
+gardées dans un checkpoint, effacé dès la suppression faite ; une reprise après
+crash supprime ce lot sans le ré-archiver. Toute autre clé (lecture arrivée en
+retard) est archivée avant suppression.
+
+Les clés antérieures à DEVICE_TIMESTAMP_MIN_MS ("1970..." : millis() d'uptime
+enregistré tel quel avant la datation à la réception) ne portent pas de date
+réelle : elles ne sont jamais compactées.
+Le job se met en pause entre deux lots et tant que l'ingest a du retard.
+
+Usage : python compaction.py --once [--retention-days 7] [--dry-run]
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from prometheus_client import Counter
+
+COMPACTION_RETENTION_DAYS = float(os.environ.get("COMPACTION_RETENTION_DAYS", 7))
+COMPACTION_BATCH_SIZE = int(os.environ.get("COMPACTION_BATCH_SIZE", 500))
+COMPACTION_PAUSE = float(os.environ.get("COMPACTION_PAUSE", 1.0))  # secondes entre deux lots
+COMPACTION_INTERVAL = float(os.environ.get("COMPACTION_INTERVAL", 6 * 3600))  # secondes entre deux passes
+COMPACTION_ARCHIVE_DIR = os.environ.get("COMPACTION_ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "archive"))
+COMPACTION_CHECKPOINT_FILE = os.environ.get("COMPACTION_CHECKPOINT_FILE",
+                                            os.path.join(COMPACTION_ARCHIVE_DIR, "checkpoint.json"))
+# même seuil que l'ingest (main.py) : en dessous, la clé n'est pas une date
+DEVICE_TIMESTAMP_MIN_MS = int(os.environ.get("DEVICE_TIMESTAMP_MIN_MS", 1577836800000))
+MIN_KEY = datetime.fromtimestamp(DEVICE_TIMESTAMP_MIN_MS / 1000).strftime("%Y%m%d_%H%M%S_%f")
+
+COMPACTION_READINGS = Counter(
+    "compaction_readings_total", "Lectures brutes traitées par la compaction", ["action"]
+)
+
+
+class ReadingCompactor:
+    def __init__(self, db_manager, archive_dir=COMPACTION_ARCHIVE_DIR, checkpoint_file=COMPACTION_CHECKPOINT_FILE,
+                 retention_days=COMPACTION_RETENTION_DAYS, batch_size=COMPACTION_BATCH_SIZE,
+                 pause=COMPACTION_PAUSE, busy_check=None, dry_run=False):
+        self.db_manager = db_manager
+        self.archive_dir = archive_dir
+        self.checkpoint_file = checkpoint_file
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.pause = pause
+        # busy_check() -> True quand l'ingest est chargé : la compaction attend
+        self.busy_check = busy_check
+        self.dry_run = dry_run
+        self.checkpoints = self._load_checkpoints()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _load_checkpoints(self):
+        if not os.path.exists(self.checkpoint_file):
+            return {}
+        with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_checkpoints(self):
+        os.makedirs(os.path.dirname(self.checkpoint_file), exist_ok=True)
+        tmp_file = self.checkpoint_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.checkpoints, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def _throttle(self):
+        self._stop_event.wait(self.pause)
+        while self.busy_check is not None and self.busy_check() and not self._stop_event.is_set():
+            self._stop_event.wait(self.pause)
+
+    def _archive(self, plant_id, items):
+        # un membre gzip ajouté par lot et par jour : le fichier reste lisible d'un bloc (gzip multi-membres)
+        by_day = {}
+        for key, value in items:
+            by_day.setdefault(key[:8], []).append(
+                json.dumps({"deviceId": plant_id, "type": "readings", "key": key, "data": value},
+                           ensure_ascii=False) + "\n"
+            )
+        plant_dir = os.path.join(self.archive_dir, plant_id)
+        os.makedirs(plant_dir, exist_ok=True)
+        for day, lines in by_day.items():
+            with open(os.path.join(plant_dir, f"{day}.ndjson.gz"), "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+                    gz.write("".join(lines).encode())
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def compact_plant(self, plant_id, cutoff):
+        done = 0
+        for page in self.db_manager.iter_child_pages(plant_id, "readings", MIN_KEY, cutoff, self.batch_size):
+            if self._stop_event.is_set():
+                break
+            pending = self.checkpoints.get(plant_id)
+            # lot archivé avant un arrêt, pas encore supprimé : seules ces clés exactes sont sautées
+            archived = set(pending) if isinstance(pending, list) else set()
+            to_archive = [(k, v) for k, v in page if k not in archived]
+            if self.dry_run:
+                done += len(page)
+                continue
+            if to_archive:
+                self._archive(plant_id, to_archive)
+                self.checkpoints[plant_id] = sorted(archived | {k for k, _ in to_archive})
+                self._save_checkpoints()
+                COMPACTION_READINGS.labels(action="archived").inc(len(to_archive))
+            self.db_manager.db_root.update({f"plants/{plant_id}/readings/{k}": None for k, _ in page})
+            COMPACTION_READINGS.labels(action="deleted").inc(len(page))
+            # suppression faite : plus rien à reprendre pour cette plante
+            if self.checkpoints.pop(plant_id, None) is not None:
+                self._save_checkpoints()
+            done += len(page)
+            self._throttle()
+        if done and not self.dry_run and self.db_manager.local_store is not None:
+            self.db_manager.local_store.delete_until(plant_id, cutoff, start=MIN_KEY)
+        return done
+
+    def run_once(self):
+        cutoff = (datetime.now() - self.retention).strftime("%Y%m%d_%H%M%S_%f")
+        print(f"[Compaction] Passe démarrée (lectures <= {cutoff}{', simulation' if self.dry_run else ''}).")
+        total = 0
+        for plant_id in self.db_manager.list_plant_ids():
+            if self._stop_event.is_set():
+                break
+            try:
+                count = self.compact_plant(plant_id, cutoff)
+            except Exception as e:
+                print(f"[Compaction] Erreur pour {plant_id}: {e}")
+                continue
+            if count:
+                print(f"[Compaction] {plant_id}: {count} lectures archivées/supprimées.")
+            total += count
+        print(f"[Compaction] Passe terminée : {total} lectures.")
+        return total
+
+    def start(self, interval=COMPACTION_INTERVAL):
+        def loop():
+            while not self._stop_event.is_set():
+                self.run_once()
+                self._stop_event.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="reading-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+
+if __name__ == "__main__":
+    from main import DatabaseManager, LocalReadingStore, SERVICE_ACCOUNT_FILE, LOCAL_STORE_PATH
+
+    parser = argparse.ArgumentParser(description="Archivage + suppression des lectures brutes anciennes")
+    parser.add_argument("--once", action="store_true", help="une seule passe puis sortie")
+    parser.add_argument("--retention-days", type=float, default=COMPACTION_RETENTION_DAYS)
+    parser.add_argument("--dry-run", action="store_true", help="compte sans archiver ni supprimer")
+    args = parser.parse_args()
+
+    local_store = LocalReadingStore(LOCAL_STORE_PATH) if LOCAL_STORE_PATH else None
+    compactor = ReadingCompactor(DatabaseManager(SERVICE_ACCOUNT_FILE, local_store=local_store),
+                                 retention_days=args.retention_days, dry_run=args.dry_run)
+    if args.once:
+        compactor.run_once()
+    else:
+        compactor.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            compactor.stop()
@@ -0,0 +1,207 @@
+"""
+Stockage local des lectures (miroir SQLite de plants/<id>/readings).
+
+Firebase reste la source de vérité ; ce fichier sert de chemin de lecture
+pour l'historique. Les lectures sont indexées par (device_id, timestamp) :
+les clés "%Y%m%d_%H%M%S_%f" sont triables lexicographiquement, une requête
+par plage coûte donc O(log n + k).
+"""
+import json
+import sqlite3
+import threading
+
+
+class LocalReadingStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # une seule connexion partagée, protégée par le verrou (WAL : lecteurs d'autres processus OK)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            " device_id TEXT NOT NULL, ts TEXT NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (device_id, ts)) WITHOUT ROWID"
+        )
+        # première clé mirrorée par plante : avant elle, seul Firebase est complet
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS coverage (device_id TEXT PRIMARY KEY, first_ts TEXT NOT NULL)"
+        )
+        # agrégats min/max/somme/nombre par (plante, résolution, intervalle, mesure)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollups ("
+            " device_id TEXT NOT NULL, resolution TEXT NOT NULL, bucket TEXT NOT NULL, metric TEXT NOT NULL,"
+            " min REAL NOT NULL, max REAL NOT NULL, sum REAL NOT NULL, count INTEGER NOT NULL,"
+            " PRIMARY KEY (device_id, resolution, bucket, metric)) WITHOUT ROWID"
+        )
+        print(f"[LocalStore] Base locale ouverte: {path}")
+
+    def add_many(self, rows):
+        # rows: liste de (device_id, data_dict) contenant data_dict["timestamp"]
+        if not rows:
+            return
+        records = [(device_id, data["timestamp"], json.dumps(data)) for device_id, data in rows]
+        first_keys = {}
+        for device_id, ts, _ in records:
+            if device_id not in first_keys or ts < first_keys[device_id]:
+                first_keys[device_id] = ts
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?)", records)
+                self.conn.executemany("INSERT OR IGNORE INTO coverage VALUES (?, ?)", first_keys.items())
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def covers(self, device_id, start=None):
+        # vrai si toutes les lectures à partir de `start` sont présentes localement
+        if start is None:
+            return False
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT first_ts FROM coverage WHERE device_id = ?", (device_id,)
+            ).fetchone()
+        return row is not None and start >= row[0]
+
+    def query(self, device_id, start=None, end=None, limit=None, after=None):
+        # `after` : borne basse exclusive (curseur de pagination)
+        sql = "SELECT data FROM readings WHERE device_id = ?"
+        params = [device_id]
+        if start is not None:
+            sql += " AND ts >= ?"
+            params.append(start)
+        if after is not None:
+            sql += " AND ts > ?"
+            params.append(after)
+        if end is not None:
+            sql += " AND ts <= ?"
+            params.append(end)
+        sql += " ORDER BY ts"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def coverage_start(self, device_id):
+        # première clé couverte ("" : tout l'historique), None si la plante n'est pas mirrorée
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT first_ts FROM coverage WHERE device_id = ?", (device_id,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def latest(self, device_id, first_ts, end=None, limit=100):
+        # les `limit` lectures les plus récentes (<= end), ordre croissant, si la plage couverte
+        # [first_ts, maintenant] les contient toutes ; sinon None (Firebase a les plus anciennes)
+        sql = "SELECT data FROM readings WHERE device_id = ? AND ts >= ?"
+        params = [device_id, first_ts]
+        if end is not None:
+            sql += " AND ts <= ?"
+            params.append(end)
+        with self._lock:
+            rows = self.conn.execute(sql + " ORDER BY ts DESC LIMIT ?", params + [int(limit)]).fetchall()
+        if len(rows) < limit and first_ts != "":
+            return None
+        return [json.loads(data) for (data,) in reversed(rows)]
+
+    def extend_coverage(self, device_id, items, first_ts, expected):
+        # items : (clé, lecture) lus dans Firebase, contigus de first_ts jusqu'à maintenant.
+        # La couverture descend à first_ts si elle vaut toujours `expected` (pas de reset entre-temps)
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO readings VALUES (?, ?, ?)",
+                    [(device_id, key, json.dumps(data)) for key, data in items]
+                )
+                self.conn.execute(
+                    "UPDATE coverage SET first_ts = ? WHERE device_id = ? AND first_ts = ? AND first_ts > ?",
+                    (first_ts, device_id, expected, first_ts)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def update_field(self, device_id, field, values):
+        # values: {ts: valeur} -> réécrit un champ des lectures présentes (ex. émotion recalculée)
+        if not values:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "UPDATE readings SET data = json_set(data, ?, ?) WHERE device_id = ? AND ts = ?",
+                    [(f"$.{field}", value, device_id, ts) for ts, value in values.items()]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def reset_coverage(self):
+        # oublie toutes les bornes : chaque plante redevient couverte à partir de sa prochaine lecture
+        with self._lock:
+            self.conn.execute("DELETE FROM coverage")
+
+    def delete_until(self, device_id, end, start=""):
+        # rétention : supprime les lectures de [start, end] (les agrégats sont conservés)
+        with self._lock:
+            return self.conn.execute(
+                "DELETE FROM readings WHERE device_id = ? AND ts >= ? AND ts <= ?", (device_id, start, end)
+            ).rowcount
+
+    def merge_rollups(self, rows):
+        # rows: (device_id, resolution, bucket, metric, min, max, sum, count) = deltas à fusionner
+        if not rows:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (device_id, resolution, bucket, metric) DO UPDATE SET"
+                    " min = min(rollups.min, excluded.min), max = max(rollups.max, excluded.max),"
+                    " sum = rollups.sum + excluded.sum, count = rollups.count + excluded.count",
+                    rows
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def query_rollups(self, device_id, resolution, start=None, end=None, limit=None, newest=False):
+        # renvoie [(bucket, metric, min, max, sum, count)] triés par intervalle
+        # newest : les `limit` derniers intervalles plutôt que les premiers
+        sql = "SELECT bucket, metric, min, max, sum, count FROM rollups WHERE device_id = ? AND resolution = ?"
+        params = [device_id, resolution]
+        if start is not None:
+            sql += " AND bucket >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND bucket <= ?"
+            params.append(end)
+        if limit is not None:
+            # limite exprimée en intervalles, pas en lignes (une ligne par mesure)
+            sql += " AND bucket IN (SELECT DISTINCT bucket FROM rollups WHERE device_id = ? AND resolution = ?"
+            params += [device_id, resolution]
+            if start is not None:
+                sql += " AND bucket >= ?"
+                params.append(start)
+            if end is not None:
+                sql += " AND bucket <= ?"
+                params.append(end)
+            sql += f" ORDER BY bucket{' DESC' if newest else ''} LIMIT ?)"
+            params.append(int(limit))
+        sql += " ORDER BY bucket"
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
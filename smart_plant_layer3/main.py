@@ -2,17 +2,32 @@ import os
 import json
 import time
 import ssl
-import requests
+import queue
+import atexit
+import threading
+import zlib
+import base64
+import binascii
+import random
+import socket
+import hmac
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+import numpy as np
 import paho.mqtt.client as mqtt
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import firebase_admin
 from firebase_admin import credentials, db, auth, storage
 from prometheus_flask_exporter import PrometheusMetrics
+from prometheus_client import Counter, Histogram, Gauge
 import cloudinary
 
+from local_store import LocalReadingStore
+import profiler
+
 # ------------------------
 # Configuration (modifiables via ENV)
 # ------------------------
@@ -24,6 +39,107 @@ MQTT_PASSWORD = os.environ.get("MQTT_PASSWORD", "Japodisehell1234")
 # Topic par défaut compatible avec la plupart des ESP : "plant/+/telemetry"
 MQTT_TELEMETRY_TOPIC_TEMPLATE = os.environ.get("MQTT_TELEMETRY_TOPIC_TEMPLATE", "plant/+/telemetry")
 MQTT_COMMAND_TOPIC_TEMPLATE = os.environ.get("MQTT_COMMAND_TOPIC_TEMPLATE", "plant/{device_id}/commands")
+# Accusés de réception des commandes (payload = la commande exécutée) ; vide = pas d'ack attendu
+MQTT_ACK_TOPIC_TEMPLATE = os.environ.get("MQTT_ACK_TOPIC_TEMPLATE", "")
+# Abonnement partagé MQTT v5 ($share/<groupe>/<topic>) : les instances du groupe se répartissent les messages
+# (base locale, donc /rollups, désactivée : chaque instance ne voit qu'une partie des lectures)
+MQTT_SHARED_GROUP = os.environ.get("MQTT_SHARED_GROUP", "")
+# Identifiant de cette instance (client MQTT, trace des commandes revendiquées)
+INSTANCE_ID = os.environ.get("INSTANCE_ID", f"{socket.gethostname()}-{os.getpid()}")
+
+# Rôle du processus : all (ingest + API), ingest (sans serveur HTTP), api (API seule, MQTT en publication)
+SERVICE_ROLE = os.environ.get("SERVICE_ROLE", "all")
+SERVICE_ROLES = ("all", "ingest", "api")
+# Élection d'un seul ingest actif parmi les processus : "" (désactivée), file (verrou local), firebase (bail)
+LEADER_ELECTION = os.environ.get("LEADER_ELECTION", "")
+LEADER_LOCK_FILE = os.environ.get("LEADER_LOCK_FILE", os.path.join(os.path.dirname(__file__), "ingest.lock"))
+LEADER_LEASE_TTL = float(os.environ.get("LEADER_LEASE_TTL", 30))  # secondes sans renouvellement avant reprise
+LEADER_RETRY_INTERVAL = float(os.environ.get("LEADER_RETRY_INTERVAL", 5))  # secondes entre deux tentatives
+# sans ingest, le processus écoute quand même la télémétrie pour le flux SSE et le cache d'état
+API_TELEMETRY_OBSERVER = os.environ.get("API_TELEMETRY_OBSERVER", "1") == "1"
+
+# Write-behind Firebase (buffer d'écriture des lectures)
+WRITE_BUFFER_ENABLED = os.environ.get("WRITE_BUFFER_ENABLED", "1") == "1"
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.environ.get("WRITE_BUFFER_FLUSH_INTERVAL", 1.0))  # secondes
+WRITE_BUFFER_BATCH_SIZE = int(os.environ.get("WRITE_BUFFER_BATCH_SIZE", 500))
+WRITE_BUFFER_MAX_QUEUE = int(os.environ.get("WRITE_BUFFER_MAX_QUEUE", 10000))
+WRITE_BUFFER_PUT_TIMEOUT = float(os.environ.get("WRITE_BUFFER_PUT_TIMEOUT", 0.5))  # secondes
+
+# Pool de traitement des messages MQTT (0 = traitement dans le thread réseau paho)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 4))
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 1000))  # par worker
+
+# Dispatch des commandes (sauvegarde + publication + notification hors du chemin critique)
+COMMAND_QUEUE_SIZE = int(os.environ.get("COMMAND_QUEUE_SIZE", 1000))  # par worker
+COMMAND_WORKERS = int(os.environ.get("COMMAND_WORKERS", 4))  # une plante => toujours le même worker
+
+# Base locale des lectures (chemin de lecture de l'historique, vide = désactivée)
+LOCAL_STORE_PATH = os.environ.get("LOCAL_STORE_PATH", os.path.join(os.path.dirname(__file__), "readings.db"))
+
+# Horodatage ESP plus ancien (ms epoch, défaut 2020-01-01) : millis() d'uptime du firmware, pas une date
+# => la lecture est datée à sa réception (clés, historique, rollups et rétention en heure serveur)
+DEVICE_TIMESTAMP_MIN_MS = int(os.environ.get("DEVICE_TIMESTAMP_MIN_MS", 1577836800000))
+
+# Pagination de /plants/<plant_id>/history
+HISTORY_DEFAULT_LIMIT = int(os.environ.get("HISTORY_DEFAULT_LIMIT", 500))
+HISTORY_MAX_LIMIT = int(os.environ.get("HISTORY_MAX_LIMIT", 5000))
+
+# Cache du dernier état par plante (alimenté par l'ingest, lu par /plants/<plant_id>/state)
+STATE_CACHE_TTL = float(os.environ.get("STATE_CACHE_TTL", 30))  # secondes
+STATE_CACHE_MAX_SIZE = int(os.environ.get("STATE_CACHE_MAX_SIZE", 10000))
+
+# Export NDJSON de /admin/all-data (taille des pages lues dans Firebase)
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", 1000))
+# Sous-arbres d'une plante lus par pages (les autres enfants sont petits : last_update, name...)
+PAGED_PLANT_CHILDREN = ("readings", "commands")
+
+# Regroupement des notifications (0 = une notification Firebase par appel)
+NOTIF_COALESCE_WINDOW = float(os.environ.get("NOTIF_COALESCE_WINDOW", 300))  # secondes
+NOTIF_FLUSH_INTERVAL = float(os.environ.get("NOTIF_FLUSH_INTERVAL", 5))  # secondes
+
+# Contrôleur d'actionnement (anti-commandes redondantes)
+ACTUATION_ENABLED = os.environ.get("ACTUATION_ENABLED", "1") == "1"
+ACTUATION_COOLDOWN = float(os.environ.get("ACTUATION_COOLDOWN", 600))  # secondes avant de renvoyer la même commande
+ACTUATION_ACK_TIMEOUT = float(os.environ.get("ACTUATION_ACK_TIMEOUT", 60))  # secondes avant de renvoyer sans ack
+ACTUATION_SNAPSHOT_INTERVAL = float(os.environ.get("ACTUATION_SNAPSHOT_INTERVAL", 30))  # secondes
+ACTUATION_STATE_FILE = os.environ.get("ACTUATION_STATE_FILE",
+                                      os.path.join(os.path.dirname(__file__), "actuation_state.json"))
+# Actionneurs à consigne (commande = état cible) : renvoyés seulement si la cible change ou sans ack.
+# Les autres (WATER_PUMP : chaque commande répète l'action) suivent le cooldown et l'hystérésis.
+ACTUATION_IDEMPOTENT = set(filter(None, os.environ.get("ACTUATION_IDEMPOTENT",
+                                                      "SET_LED_COLOR,SET_FAN_SPEED").split(",")))
+# Consigne inchangée renvoyée quand même après ce délai : un ESP redémarré a perdu sa LED / son ventilateur
+ACTUATION_RESYNC_INTERVAL = float(os.environ.get("ACTUATION_RESYNC_INTERVAL", 1800))  # secondes
+# Hystérésis : un régime (ex. arrosage déclenché sous 30 %) ne se termine qu'au-delà du seuil de sortie
+ACTUATION_HYSTERESIS = {
+    "WATER_PUMP": ("soil_moisture", ">=", float(os.environ.get("WATER_PUMP_EXIT_SOIL", 35))),
+    "SET_FAN_SPEED": ("temperature", "<=", float(os.environ.get("FAN_EXIT_TEMPERATURE", 33))),
+}
+
+# Flux SSE /plants/<plant_id>/stream
+STREAM_BUFFER_SIZE = int(os.environ.get("STREAM_BUFFER_SIZE", 100))  # événements en attente par abonné
+STREAM_HEARTBEAT = float(os.environ.get("STREAM_HEARTBEAT", 15))  # secondes
+# serveur threadé (Flask/gunicorn gthread) : chaque flux ouvert occupe un thread ; au-delà -> 503
+# pour garder des threads aux autres routes (beaucoup de spectateurs : servir asgi.py)
+STREAM_MAX_THREADED = int(os.environ.get("STREAM_MAX_THREADED", 8))
+
+# Agrégats (rollups) par plante : résolution -> longueur du préfixe de la clé "%Y%m%d_%H%M%S_%f"
+ROLLUP_RESOLUTIONS = {"1m": len("20250101_0000"), "1h": len("20250101_00"), "1d": len("20250101")}
+ROLLUP_METRICS = ("soilMoisture", "temperature", "lightLevel", "humidity")
+ROLLUP_FLUSH_INTERVAL = float(os.environ.get("ROLLUP_FLUSH_INTERVAL", 10))  # secondes
+ROLLUP_DEFAULT_LIMIT = int(os.environ.get("ROLLUP_DEFAULT_LIMIT", 1000))
+
+# Instrumentation de l'ingest : au-delà de N plantes, les compteurs par plante vont dans "_other"
+INGEST_DEVICE_LABELS_MAX = int(os.environ.get("INGEST_DEVICE_LABELS_MAX", 200))
+
+# Profilage à la demande (/admin/profile, /admin/tracemalloc) : désactivé tant que ADMIN_TOKEN est vide
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+PROFILE_DEFAULT_INTERVAL = float(os.environ.get("PROFILE_DEFAULT_INTERVAL", 0.01))  # secondes entre échantillons
+
+# Rétention des lectures brutes (compaction.py) : désactivée par défaut, elle supprime des données
+COMPACTION_ENABLED = os.environ.get("COMPACTION_ENABLED", "0") == "1"
+COMPACTION_BUSY_BACKLOG = int(os.environ.get("COMPACTION_BUSY_BACKLOG", 100))  # messages en attente d'ingest
 
 # Cloudinary (optionnel)
 cloudinary.config(
@@ -45,26 +161,266 @@ if FIREBASE_KEY_ENV:
     except Exception as e:
         print("[CONFIG] Impossible d'écrire le fichier de service Firebase:", e)
 
+# ------------------------
+# Métriques Prometheus (exposées sur /metrics avec celles de Flask)
+# ------------------------
+WRITE_BUFFER_BATCH_SIZE_HIST = Histogram(
+    "firebase_write_batch_size", "Nombre de lectures par flush du buffer d'écriture",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+WRITE_BUFFER_FLUSH_SECONDS = Histogram(
+    "firebase_write_flush_seconds", "Durée d'un flush multi-path vers Firebase"
+)
+WRITE_BUFFER_READINGS = Counter(
+    "firebase_write_readings_total", "Lectures traitées par le buffer d'écriture", ["result"]
+)
+INGEST_QUEUE_DEPTH = Gauge(
+    "ingest_queue_depth", "Messages MQTT en attente par worker", ["worker"]
+)
+INGEST_QUEUE_WAIT_SECONDS = Histogram(
+    "ingest_queue_wait_seconds", "Attente d'un message entre le callback paho et son worker"
+)
+INGEST_HANDLER_SECONDS = Histogram(
+    "ingest_handler_seconds", "Durée de traitement d'un message par un worker"
+)
+INGEST_DROPPED = Counter(
+    "ingest_dropped_total", "Messages MQTT ignorés car la file du worker est pleine"
+)
+STATE_CACHE_REQUESTS = Counter(
+    "state_cache_requests_total", "Lectures du cache d'état (hit/miss)", ["result"]
+)
+STATE_CACHE_EVICTIONS = Counter(
+    "state_cache_evictions_total", "Entrées retirées du cache d'état", ["reason"]
+)
+NOTIFICATIONS_EMITTED = Counter(
+    "notifications_emitted_total", "Notifications écrites dans Firebase", ["mode"]
+)
+NOTIFICATIONS_SUPPRESSED = Counter(
+    "notifications_suppressed_total", "Notifications fusionnées dans une notification agrégée"
+)
+ACTUATION_DECISIONS = Counter(
+    "actuation_decisions_total", "Commandes automatiques émises ou supprimées par le contrôleur", ["result"]
+)
+STREAM_SUBSCRIBERS = Gauge(
+    "stream_subscribers", "Abonnés connectés au flux SSE des lectures"
+)
+STREAM_DROPPED_SUBSCRIBERS = Counter(
+    "stream_dropped_subscribers_total", "Abonnés SSE déconnectés car trop lents"
+)
+ROLLUP_FLUSH_ROWS = Histogram(
+    "rollup_flush_rows", "Lignes d'agrégats fusionnées par flush",
+    buckets=(1, 10, 100, 1000, 10000, 100000)
+)
+COMMANDS_DISPATCHED = Counter(
+    "commands_dispatched_total", "Commandes traitées par le CommandDispatcher", ["source", "result"]
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "ingest_stage_seconds", "Durée de chaque étape du traitement d'un message MQTT", ["stage"],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+             0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+INGEST_MESSAGES = Counter(
+    "ingest_messages_total", "Messages de télémétrie reçus par plante (cardinalité bornée)", ["device"]
+)
+INGEST_PARSE_ERRORS = Counter(
+    "ingest_parse_errors_total", "Messages de télémétrie rejetés, par raison", ["reason"]
+)
+FIREBASE_CALL_SECONDS = Histogram(
+    "firebase_call_seconds", "Latence des appels Firebase par opération", ["operation"]
+)
+INGEST_LEADER = Gauge(
+    "ingest_leader", "1 si ce processus est l'ingest élu (LEADER_ELECTION)"
+)
+FIREBASE_CALL_ERRORS = Counter(
+    "firebase_call_errors_total", "Appels Firebase en erreur par opération", ["operation"]
+)
+# étapes résolues une fois : pas de recherche de labels sur le chemin critique
+STAGE_DECODE, STAGE_PARSE, STAGE_SENSORDATA, STAGE_EMOTION, STAGE_DECISION, STAGE_SAVE, STAGE_FANOUT, \
+    STAGE_COMMAND, STAGE_NOTIFY = (
+        INGEST_STAGE_SECONDS.labels(stage=stage)
+        for stage in ("decode", "parse", "sensordata", "emotion", "decision", "save", "fanout", "command", "notify")
+    )
+
+
+@contextmanager
+def firebase_timer(operation):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        FIREBASE_CALL_ERRORS.labels(operation=operation).inc()
+        raise
+    finally:
+        FIREBASE_CALL_SECONDS.labels(operation=operation).observe(time.perf_counter() - start)
+
+
+class BoundedLabel:
+    # les `limit` premières valeurs gardent leur label, les suivantes partagent `overflow`
+    def __init__(self, limit, overflow="_other"):
+        self.limit = limit
+        self.overflow = overflow
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        if value in self._known:
+            return value
+        with self._lock:
+            if len(self._known) < self.limit:
+                self._known.add(value)
+                return value
+        return self.overflow
+
+
+TIMESTAMP_KEY_FORMAT = "%Y%m%d_%H%M%S_%f"
+TIMESTAMP_KEY_LENGTH = len("20250101_000000_000000")
+# (seconde epoch, préfixe "%Y%m%d_%H%M%S") : strftime une seule fois par seconde
+_timestamp_prefix_cache = (None, "")
+
+
+def timestamp_key(timestamp_ms=None):
+    # clé "%Y%m%d_%H%M%S_%f" (heure locale) calculée arithmétiquement depuis un timestamp en ms
+    global _timestamp_prefix_cache
+    micros = None
+    if timestamp_ms is not None:
+        try:
+            micros = int(timestamp_ms) * 1000
+        except (TypeError, ValueError):
+            pass
+    if micros is None:
+        micros = time.time_ns() // 1000
+    seconds, micro = divmod(micros, 1_000_000)
+    cached_seconds, prefix = _timestamp_prefix_cache
+    if seconds != cached_seconds:
+        try:
+            prefix = time.strftime("%Y%m%d_%H%M%S", time.localtime(seconds))
+        except (OverflowError, OSError, ValueError):
+            return timestamp_key()
+        _timestamp_prefix_cache = (seconds, prefix)
+    return f"{prefix}_{micro:06d}"
+
+
+def reading_key(timestamp_ms=None):
+    # clé d'une lecture : horodatage de l'ESP s'il est plausible, sinon heure de réception
+    try:
+        if int(timestamp_ms) >= DEVICE_TIMESTAMP_MIN_MS:
+            return timestamp_key(timestamp_ms)
+    except (TypeError, ValueError):
+        pass
+    return timestamp_key()
+
+
+def to_timestamp_key(value, upper=False):
+    # accepte un timestamp en ms (comme les ESP) ou une clé / un préfixe "%Y%m%d_%H%M%S_%f"
+    if value is None or value == "":
+        return None
+    if value.isdigit() and len(value) >= 10:
+        return timestamp_key(value)
+    if upper and len(value) < TIMESTAMP_KEY_LENGTH:
+        # borne haute inclusive pour un préfixe ("20251012" => toute la journée)
+        return value + "\uf8ff"
+    return value
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode()).decode() if key else None
+
+
+def decode_cursor(cursor):
+    # curseur opaque = clé de la dernière lecture renvoyée ; ValueError si invalide
+    if not cursor:
+        return None
+    try:
+        # validate=True : un caractère hors alphabet est une erreur, pas un octet ignoré
+        key = base64.b64decode(cursor.encode(), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"curseur invalide: {e}")
+    if not key:
+        raise ValueError("curseur invalide: vide")
+    return key
+
+
+def int_arg(args, name, default):
+    # comme request.args.get(name, default, type=int) : valeur invalide -> défaut
+    try:
+        return int(args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def gzip_stream(chunks):
+    # compression gzip en flux (wbits=31 => en-tête gzip)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
 
 # ==========================
 # 1. Model
 # ==========================
+class InvalidReading(ValueError):
+    # `reason` sert de label à ingest_parse_errors_total
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
 class SensorData:
+    __slots__ = ("device_id", "soil_moisture", "temperature", "light_level", "humidity", "timestamp")
+
+    # plages physiquement possibles ; hors plage (ou NaN) => ValueError
+    RANGES = {
+        "soilMoisture": (0.0, 100.0),
+        "temperature": (-40.0, 80.0),
+        "lightLevel": (0.0, float("inf")),
+        "humidity": (0.0, 100.0),
+    }
+
     def __init__(self, deviceId, soilMoisture, temperature, lightLevel, humidity, timestamp=None, **kwargs):
-        self.device_id = deviceId
-        self.soil_moisture = float(soilMoisture)
-        self.temperature = float(temperature)
-        self.light_level = float(lightLevel)
-        self.humidity = float(humidity)
-        if timestamp is None:
-            ts = datetime.now()
-        else:
-            # attendu timestamp en ms (comme sur beaucoup d'ESP)
-            try:
-                ts = datetime.fromtimestamp(int(timestamp) / 1000)
-            except Exception:
-                ts = datetime.now()
-        self.timestamp = ts.strftime("%Y%m%d_%H%M%S_%f")
+        self._set(deviceId, float(soilMoisture), float(temperature), float(lightLevel), float(humidity),
+                  timestamp)
+
+    def _set(self, device_id, soil, temp, light, hum, timestamp):
+        # une seule comparaison chaînée dans le cas nominal (NaN échoue aussi)
+        if not (0.0 <= soil <= 100.0 and -40.0 <= temp <= 80.0 and 0.0 <= light and 0.0 <= hum <= 100.0):
+            for field, value in (("soilMoisture", soil), ("temperature", temp),
+                                 ("lightLevel", light), ("humidity", hum)):
+                low, high = self.RANGES[field]
+                if not low <= value <= high:
+                    raise InvalidReading("out_of_range", f"{field} hors plage: {value}")
+        self.device_id = device_id
+        self.soil_moisture = soil
+        self.temperature = temp
+        self.light_level = light
+        self.humidity = hum
+        # attendu timestamp en ms epoch ; absent ou uptime (millis() du firmware) => l'heure actuelle
+        self.timestamp = reading_key(timestamp)
+
+    @classmethod
+    def from_payload(cls, payload):
+        # décodage direct des octets MQTT (json.loads accepte bytes) + validation des champs
+        return cls.from_dict(json.loads(payload))
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise InvalidReading("not_object", "payload JSON attendu sous forme d'objet")
+        try:
+            device_id = data["deviceId"]
+            soil = float(data["soilMoisture"])
+            temp = float(data["temperature"])
+            light = float(data["lightLevel"])
+            hum = float(data["humidity"])
+        except KeyError as e:
+            raise InvalidReading("missing_field", f"champ manquant: {e.args[0]}") from None
+        except (TypeError, ValueError) as e:
+            raise InvalidReading("bad_type", f"valeur non numérique: {e}") from None
+        reading = cls.__new__(cls)
+        reading._set(device_id, soil, temp, light, hum, data.get("timestamp"))
+        return reading
 
     def to_dict(self):
         return {
@@ -76,10 +432,25 @@ class SensorData:
             "timestamp": self.timestamp
         }
 
+    def to_record(self, emotion):
+        # payload écrit tel quel dans Firebase (plants/<id>/readings/<timestamp>)
+        return {
+            "deviceId": self.device_id,
+            "soilMoisture": self.soil_moisture,
+            "temperature": self.temperature,
+            "lightLevel": self.light_level,
+            "humidity": self.humidity,
+            "timestamp": self.timestamp,
+            "emotion": emotion
+        }
+
 # ==========================
 # 2. Emotion / Decision
 # ==========================
 class EmotionEngine:
+    # codes renvoyés par determine_emotions (index dans ce tuple)
+    EMOTIONS = ("assoiffé", "stressé", "fatigué", "heureux", "neutre")
+
     def determine_emotion(self, data: SensorData):
         if data.soil_moisture < 30:
             return "assoiffé"
@@ -91,18 +462,211 @@ class EmotionEngine:
             return "heureux"
         return "neutre"
 
+    def determine_emotions(self, soil_moisture, temperature, light_level):
+        # version vectorisée des mêmes règles (tableaux colonnes) -> codes int8 dans EMOTIONS
+        soil = np.asarray(soil_moisture, dtype=np.float64)
+        temp = np.asarray(temperature, dtype=np.float64)
+        light = np.asarray(light_level, dtype=np.float64)
+        # np.select garde la première condition vraie, comme la chaîne de if
+        conditions = [
+            soil < 30,
+            temp > 35,
+            light < 15,
+            (40 < soil) & (soil < 75) & (18 < temp) & (temp < 28),
+        ]
+        return np.select(conditions, [0, 1, 2, 3], default=4).astype(np.int8)
+
 class DecisionMaker:
+    # codes renvoyés par decide_actions (index dans ce tuple, NO_ACTION si aucune commande)
+    ACTIONS = ("WATER_PUMP:3000", "SET_FAN_SPEED:150", "SET_LED_COLOR:GREEN")
+    NO_ACTION = -1
+
+    def __init__(self):
+        # table émotion -> action dérivée de decide_action : les deux API restent cohérentes
+        self._action_table = np.array(
+            [self.ACTIONS.index(a) if (a := self.decide_action(e)) else self.NO_ACTION
+             for e in EmotionEngine.EMOTIONS],
+            dtype=np.int8
+        )
+
     def decide_action(self, emotion: str):
         if emotion == "assoiffé": return "WATER_PUMP:3000"
         if emotion == "stressé": return "SET_FAN_SPEED:150"
         if emotion == "heureux": return "SET_LED_COLOR:GREEN"
         return None
 
+    def decide_actions(self, emotion_codes):
+        return self._action_table[np.asarray(emotion_codes, dtype=np.intp)]
+
+# ==========================
+# 2b. Actuation Controller (état par plante)
+# ==========================
+class ActuationController:
+    def __init__(self, state_file=ACTUATION_STATE_FILE, cooldown=ACTUATION_COOLDOWN,
+                 ack_timeout=ACTUATION_ACK_TIMEOUT, require_ack=bool(MQTT_ACK_TOPIC_TEMPLATE),
+                 snapshot_interval=ACTUATION_SNAPSHOT_INTERVAL, shared_state=None,
+                 resync_interval=ACTUATION_RESYNC_INTERVAL):
+        self.state_file = state_file
+        self.cooldown = cooldown
+        self.ack_timeout = ack_timeout
+        self.resync_interval = resync_interval
+        self.require_ack = require_ack
+        self.snapshot_interval = snapshot_interval
+        # DatabaseManager (update_actuation) quand plusieurs instances d'ingest se partagent les plantes
+        self.shared_state = shared_state
+        # device_id -> actionneur -> {"command", "sent_at" (epoch), "active", "pending"}
+        self.state = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="actuation-snapshot", daemon=True)
+        self._load()
+
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+            print(f"[Actuation] État restauré pour {len(self.state)} plante(s).")
+        except Exception as e:
+            print(f"[Actuation] Erreur lecture snapshot: {e}")
+
+    def start(self):
+        if self.state_file:
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _suppresses(self, entry, command, now):
+        # vrai si `entry` (dernière commande envoyée à cet actionneur) bloque un nouvel envoi
+        if not entry or entry.get("command") != command:
+            return False
+        elapsed = now - entry["sent_at"]
+        if command.split(":", 1)[0] in ACTUATION_IDEMPOTENT:
+            # consigne déjà envoyée : renvoi sur ack manquant, ou périodique (sans ack, rien ne
+            # dit que l'ESP l'applique encore après un redémarrage)
+            if elapsed >= self.resync_interval:
+                return False
+            return not entry.get("pending") or elapsed < self.ack_timeout
+        if not entry.get("active"):
+            return False
+        return elapsed < (self.ack_timeout if entry.get("pending") else self.cooldown)
+
+    def decide(self, sensor_data: SensorData, command, now=None):
+        # renvoie la commande à envoyer, ou None si elle ne change rien à l'état de la plante
+        now = time.time() if now is None else now
+        device_id = sensor_data.device_id
+        exited = []
+        issued = None
+        with self._lock:
+            actuators = self.state.setdefault(device_id, {})
+            # sortie d'hystérésis : le régime se termine quand la mesure repasse le seuil de sortie
+            for actuator, entry in actuators.items():
+                rule = ACTUATION_HYSTERESIS.get(actuator)
+                if entry["active"] and rule:
+                    field, op, threshold = rule
+                    value = getattr(sensor_data, field)
+                    if (value >= threshold) if op == ">=" else (value <= threshold):
+                        entry["active"] = False
+                        self._dirty = True
+                        exited.append((actuator, dict(entry)))
+            if command:
+                actuator = command.split(":", 1)[0]
+                if not self._suppresses(actuators.get(actuator), command, now):
+                    issued = {"command": command, "sent_at": now, "active": True, "pending": self.require_ack}
+                    if self.shared_state is None:
+                        actuators[actuator] = issued
+                        self._dirty = True
+        if self.shared_state is not None:
+            for exited_actuator, entry in exited:
+                self._release(device_id, exited_actuator, entry)
+            if issued is not None and not self._claim(device_id, actuator, issued):
+                issued = None
+        if not command:
+            return None
+        ACTUATION_DECISIONS.labels(result="issued" if issued else "suppressed").inc()
+        return command if issued else None
+
+    def _update_shared(self, device_id, actuator, update_fn):
+        try:
+            current = self.shared_state.update_actuation(device_id, actuator, update_fn)
+        except Exception as e:
+            print(f"[Actuation] Erreur état partagé {device_id}/{actuator}: {e}")
+            return None, False
+        with self._lock:
+            if current:
+                self.state.setdefault(device_id, {})[actuator] = current
+                self._dirty = True
+        return current, True
+
+    def _claim(self, device_id, actuator, entry):
+        # transaction : une seule instance envoie la commande, les autres adoptent son état
+        result = {}
+
+        def update(current):
+            result["claimed"] = not self._suppresses(current, entry["command"], entry["sent_at"])
+            return dict(entry, instance=INSTANCE_ID) if result["claimed"] else current
+
+        _, ok = self._update_shared(device_id, actuator, update)
+        return ok and result.get("claimed", False)
+
+    def _release(self, device_id, actuator, entry):
+        # fin de régime vue ici : la partager pour que les autres instances puissent relancer la commande
+        def update(current):
+            if current and current.get("command") == entry["command"] and current.get("sent_at") == entry["sent_at"]:
+                return dict(current, active=False)
+            return current
+
+        self._update_shared(device_id, actuator, update)
+
+    def acknowledge(self, device_id, command):
+        actuator = command.split(":", 1)[0]
+        with self._lock:
+            entry = self.state.get(device_id, {}).get(actuator)
+            if entry is not None and entry["command"] == command:
+                entry["pending"] = False
+                self._dirty = True
+        if self.shared_state is not None:
+            def update(current):
+                if current and current.get("command") == command and current.get("pending"):
+                    return dict(current, pending=False)
+                return current
+
+            self._update_shared(device_id, actuator, update)
+
+    def snapshot(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self.state)
+            self._dirty = False
+        try:
+            tmp_file = self.state_file + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            print(f"[Actuation] Erreur écriture snapshot: {e}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.snapshot_interval):
+            self.snapshot()
+
+    def stop(self, timeout=10):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        self.snapshot()
+
 # ==========================
 # 3. Database Manager
 # ==========================
 class DatabaseManager:
-    def __init__(self, service_account_file):
+    def __init__(self, service_account_file, local_store: LocalReadingStore = None):
+        self.local_store = local_store
+        self.local_reads = local_store is not None
         print(f"[DatabaseManager] Tentative de connexion avec {service_account_file}")
         if not os.path.exists(service_account_file):
             raise FileNotFoundError(f"Le fichier de clé Firebase '{service_account_file}' est introuvable.")
@@ -133,40 +697,447 @@ class DatabaseManager:
 
     def save_reading(self, device_id, data_dict):
         try:
-            readings_ref = self.db_root.child("plants").child(device_id).child("readings")
-            readings_ref.child(data_dict["timestamp"]).set(data_dict)
-            self.db_root.child("plants").child(device_id).child("last_update").set(data_dict)
+            with firebase_timer("save_reading"):
+                readings_ref = self.db_root.child("plants").child(device_id).child("readings")
+                readings_ref.child(data_dict["timestamp"]).set(data_dict)
+                self.db_root.child("plants").child(device_id).child("last_update").set(data_dict)
+            self._mirror([(device_id, data_dict)])
             print(f"[DatabaseManager] Données enregistrées pour {device_id}.")
             return True
         except Exception as e:
             print(f"[DatabaseManager] Erreur save_reading: {e}")
             return False
 
+    def save_readings_batch(self, batch):
+        # batch: liste de (device_id, data_dict) -> une seule requête multi-path
+        updates = {}
+        latest = {}
+        for device_id, data_dict in batch:
+            updates[f"plants/{device_id}/readings/{data_dict['timestamp']}"] = data_dict
+            previous = latest.get(device_id)
+            if previous is None or data_dict["timestamp"] >= previous["timestamp"]:
+                latest[device_id] = data_dict
+        # last_update écrit une seule fois par plante et par flush
+        for device_id, data_dict in latest.items():
+            updates[f"plants/{device_id}/last_update"] = data_dict
+        try:
+            with firebase_timer("save_readings_batch"):
+                self.db_root.update(updates)
+            self._mirror(batch)
+            print(f"[DatabaseManager] {len(batch)} lectures enregistrées pour {len(latest)} plante(s).")
+            return True
+        except Exception as e:
+            print(f"[DatabaseManager] Erreur save_readings_batch: {e}")
+            return False
+
+    def set_local_reads(self, enabled, reset_coverage=False):
+        # bail entre hôtes : le miroir n'est complet que depuis la dernière prise de l'ingest
+        if self.local_store is None:
+            return
+        self.local_reads = enabled
+        if reset_coverage:
+            self.local_store.reset_coverage()
+
+    def _mirror(self, rows):
+        # copie locale des lectures déjà écrites dans Firebase
+        if self.local_store is None:
+            return
+        try:
+            self.local_store.add_many(rows)
+        except Exception as e:
+            print(f"[DatabaseManager] Erreur miroir local: {e}")
+
     def save_command(self, device_id, command):
         timestamp = datetime.now().isoformat().replace(":", "_").replace(".", "_")
         data_to_save = {"deviceId": device_id, "command": command, "timestamp": timestamp}
         try:
-            self.db_root.child("plants").child(device_id).child("commands").child(timestamp).set(data_to_save)
-            self.db_root.child("plants").child(device_id).child("last_command").set(data_to_save)
+            # historique + dernière commande en une seule requête multi-path
+            with firebase_timer("save_command"):
+                self.db_root.update({
+                    f"plants/{device_id}/commands/{timestamp}": data_to_save,
+                    f"plants/{device_id}/last_command": data_to_save,
+                })
             print(f"[DatabaseManager] Commande enregistrée pour {device_id}: {command}")
             return True
         except Exception as e:
             print(f"[DatabaseManager] Erreur save_command: {e}")
             return False
 
+    def list_plant_ids(self):
+        # listing "shallow" : uniquement les clés, pas les sous-arbres
+        with firebase_timer("list_plant_ids"):
+            return sorted((self.db_root.child("plants").get(shallow=True) or {}).keys())
+
+    def list_plant_children(self, plant_id):
+        with firebase_timer("list_plant_children"):
+            return sorted((self.db_root.child("plants").child(plant_id).get(shallow=True) or {}).keys())
+
+    def get_plant_child(self, plant_id, child):
+        with firebase_timer("get_plant_child"):
+            return self.db_root.child("plants").child(plant_id).child(child).get()
+
+    def iter_child_pages(self, plant_id, child, start=None, end=None, page_size=EXPORT_PAGE_SIZE):
+        # parcourt plants/<id>/<child> par pages ordonnées par clé : mémoire constante
+        after = None
+        while True:
+            query = self.db_root.child("plants").child(plant_id).child(child).order_by_key()
+            lower = after if after is not None else start
+            if lower is not None:
+                query = query.start_at(lower)
+            if end is not None:
+                query = query.end_at(end)
+            query = query.limit_to_first(page_size + (1 if after is not None else 0))
+            with firebase_timer("query_page"):
+                result = query.get() or {}
+            items = [(k, v) for k, v in result.items() if after is None or k > after]
+            if not items:
+                return
+            yield items
+            if len(items) < page_size:
+                return
+            after = items[-1][0]
+
+    def update_actuation(self, device_id, actuator, update_fn):
+        # transaction sur plants/<id>/actuation/<actionneur> (état partagé entre instances d'ingest)
+        ref = self.db_root.child("plants").child(device_id).child("actuation").child(actuator)
+        with firebase_timer("update_actuation"):
+            return ref.transaction(update_fn)
+
+    def update_leader_lease(self, update_fn):
+        # transaction sur service/ingest_leader (élection de l'ingest entre hôtes)
+        ref = self.db_root.child("service").child("ingest_leader")
+        with firebase_timer("update_leader_lease"):
+            return ref.transaction(update_fn)
+
     def get_latest_state(self, plant_id):
-        return self.db_root.child("plants").child(plant_id).child("last_update").get()
+        with firebase_timer("get_latest_state"):
+            return self.db_root.child("plants").child(plant_id).child("last_update").get()
+
+    def get_latest_readings(self, plant_id, end=None, limit=HISTORY_DEFAULT_LIMIT):
+        # dernières clés : ne dépend pas de l'horloge des ESP (pas de borne basse en heure murale)
+        covered_from = self.local_store.coverage_start(plant_id) if self.local_reads else None
+        if covered_from is not None:
+            readings = self.local_store.latest(plant_id, covered_from, end, limit)
+            if readings is not None:
+                return readings
+        items = self._query_latest(plant_id, end, limit)
+        if covered_from is not None and end is None:
+            # réponse contiguë jusqu'à maintenant : la plage couverte rejoint sa première clé,
+            # ou tout l'historique s'il tient dans la page
+            try:
+                first_ts = items[0][0] if len(items) == limit else ""
+                self.local_store.extend_coverage(plant_id, items, first_ts, covered_from)
+            except Exception as e:
+                print(f"[DatabaseManager] Erreur miroir local: {e}")
+        return [data for _, data in items]
+
+    def _query_latest(self, plant_id, end, limit):
+        query = self.db_root.child("plants").child(plant_id).child("readings").order_by_key()
+        if end is not None:
+            query = query.end_at(end)
+        with firebase_timer("get_readings"):
+            result = query.limit_to_last(limit).get() or {}
+        return sorted(result.items())
 
     def get_all_readings(self, plant_id):
-        readings = self.db_root.child("plants").child(plant_id).child("readings").get()
+        with firebase_timer("get_all_readings"):
+            readings = self.db_root.child("plants").child(plant_id).child("readings").get()
         return list(readings.values()) if readings else []
 
+    def get_readings(self, plant_id, start=None, end=None, limit=HISTORY_DEFAULT_LIMIT, after=None):
+        # une page de lectures triées par clé + clé de reprise (None si dernière page)
+        # sans start ni after : les `limit` lectures les plus récentes (<= end), sans clé de reprise
+        if start is None and after is None:
+            return self.get_latest_readings(plant_id, end, limit), None
+        lower = max(start, after) if start is not None and after is not None else (after or start)
+        if self.local_reads and self.local_store.covers(plant_id, lower):
+            readings = self.local_store.query(plant_id, start, end, limit + 1, after=after)
+            page = readings[:limit]
+            next_key = page[-1]["timestamp"] if len(readings) > limit else None
+            return page, next_key
+        # requête Firebase ordonnée et limitée : le sous-arbre complet n'est jamais téléchargé
+        query = self.db_root.child("plants").child(plant_id).child("readings").order_by_key()
+        if lower is not None:
+            query = query.start_at(lower)
+        if end is not None:
+            query = query.end_at(end)
+        # +1 pour savoir s'il reste des données, +1 si la clé du curseur (incluse par start_at) revient
+        query = query.limit_to_first(limit + (2 if after is not None else 1))
+        with firebase_timer("get_readings"):
+            result = query.get() or {}
+        items = [(k, v) for k, v in result.items() if after is None or k > after]
+        page = items[:limit]
+        next_key = page[-1][0] if len(items) > limit else None
+        return [v for _, v in page], next_key
+
+# ==========================
+# 3b. Write-behind buffer (lectures -> Firebase par lots)
+# ==========================
+class ReadingWriteBuffer:
+    def __init__(self, db_manager: DatabaseManager, flush_interval=WRITE_BUFFER_FLUSH_INTERVAL,
+                 batch_size=WRITE_BUFFER_BATCH_SIZE, max_queue=WRITE_BUFFER_MAX_QUEUE):
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="firebase-write-buffer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        # flush des lectures en attente à l'arrêt du processus
+        atexit.register(self.stop)
+        print(f"[WriteBuffer] Démarré (flush {self.flush_interval}s / {self.batch_size} lectures).")
+
+    def enqueue(self, device_id, data_dict):
+        # queue bornée : on bloque brièvement puis on abandonne la lecture
+        try:
+            self.queue.put((device_id, data_dict), timeout=WRITE_BUFFER_PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            WRITE_BUFFER_READINGS.labels(result="dropped").inc()
+            print(f"[WriteBuffer] File pleine, lecture ignorée pour {device_id}")
+            return False
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop_event.is_set():
+            try:
+                batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+        # arrêt : vider ce qui reste dans la file
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        self._flush(batch)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        saved = self.db_manager.save_readings_batch(batch)
+        WRITE_BUFFER_FLUSH_SECONDS.observe(time.perf_counter() - start)
+        WRITE_BUFFER_BATCH_SIZE_HIST.observe(len(batch))
+        WRITE_BUFFER_READINGS.labels(result="saved" if saved else "failed").inc(len(batch))
+
+    def stop(self, timeout=10):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        print("[WriteBuffer] Arrêté, lectures en attente envoyées.")
+
+# ==========================
+# 3c. Latest-state cache (write-through depuis l'ingest)
+# ==========================
+class LatestStateCache:
+    def __init__(self, ttl=STATE_CACHE_TTL, max_size=STATE_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # device_id -> (expire_at, state), ordre LRU
+        self._lock = threading.Lock()
+
+    def put(self, device_id, state):
+        with self._lock:
+            self._entries[device_id] = (time.monotonic() + self.ttl, state)
+            self._entries.move_to_end(device_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                STATE_CACHE_EVICTIONS.labels(reason="size").inc()
+
+    def get(self, device_id):
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[device_id]
+                STATE_CACHE_EVICTIONS.labels(reason="ttl").inc()
+                entry = None
+            if entry is None:
+                STATE_CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+            self._entries.move_to_end(device_id)
+        STATE_CACHE_REQUESTS.labels(result="hit").inc()
+        return entry[1]
+
+# ==========================
+# 3d. Telemetry broker (pub/sub en mémoire pour le flux SSE)
+# ==========================
+class TelemetrySubscription:
+    def __init__(self, plant_id, buffer_size):
+        self.plant_id = plant_id
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.closed = False
+        # réveil d'un consommateur asynchrone (asgi.py), appelé depuis le thread qui publie
+        self.on_event = None
+
+    def wakeup(self):
+        if self.on_event is not None:
+            self.on_event()
+
+
+class TelemetryBroker:
+    def __init__(self, buffer_size=STREAM_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers = {}  # plant_id -> set de TelemetrySubscription
+        self._lock = threading.Lock()
+
+    def subscribe(self, plant_id):
+        subscription = TelemetrySubscription(plant_id, self.buffer_size)
+        with self._lock:
+            self._subscribers.setdefault(plant_id, set()).add(subscription)
+        STREAM_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.plant_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.plant_id]
+        STREAM_SUBSCRIBERS.dec()
+
+    def publish(self, plant_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(plant_id, ()))
+        if not subscribers:
+            return
+        # sérialisé une seule fois, quel que soit le nombre d'abonnés
+        data = json.dumps(event, ensure_ascii=False)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(data)
+            except queue.Full:
+                # abonné trop lent : on le déconnecte plutôt que de ralentir l'ingest
+                subscription.closed = True
+                self.unsubscribe(subscription)
+                STREAM_DROPPED_SUBSCRIBERS.inc()
+            subscription.wakeup()
+
+# ==========================
+# 3e. Rollups (min/max/moyenne/nombre par minute, heure, jour)
+# ==========================
+class RollupAggregator:
+    def __init__(self, local_store: LocalReadingStore, flush_interval=ROLLUP_FLUSH_INTERVAL):
+        self.local_store = local_store
+        self.flush_interval = flush_interval
+        # deltas depuis le dernier flush : (device_id, résolution, intervalle) -> metric -> [min, max, somme, nombre]
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rollup-flusher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def add(self, device_id, reading):
+        # O(1) par lecture : 3 résolutions x 4 mesures
+        # clé en heure serveur quand l'ESP n'envoie qu'un uptime (reading_key) : pas d'intervalle "1970..."
+        key = reading["timestamp"]
+        with self._lock:
+            for resolution, prefix_length in ROLLUP_RESOLUTIONS.items():
+                stats = self._pending.setdefault((device_id, resolution, key[:prefix_length]), {})
+                for metric in ROLLUP_METRICS:
+                    value = reading[metric]
+                    current = stats.get(metric)
+                    if current is None:
+                        stats[metric] = [value, value, value, 1]
+                    else:
+                        if value < current[0]:
+                            current[0] = value
+                        if value > current[1]:
+                            current[1] = value
+                        current[2] += value
+                        current[3] += 1
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        rows = [
+            (device_id, resolution, bucket, metric, *values)
+            for (device_id, resolution, bucket), stats in pending.items()
+            for metric, values in stats.items()
+        ]
+        if not rows:
+            return
+        try:
+            self.local_store.merge_rollups(rows)
+            ROLLUP_FLUSH_ROWS.observe(len(rows))
+        except Exception as e:
+            print(f"[Rollups] Erreur flush: {e}")
+
+    def query(self, device_id, resolution, start=None, end=None, limit=ROLLUP_DEFAULT_LIMIT):
+        # agrégats persistés + deltas pas encore flushés, mêmes bornes ;
+        # sans start : les `limit` intervalles les plus récents (comme /history)
+        prefix_length = ROLLUP_RESOLUTIONS[resolution]
+        newest = start is None
+        start = start[:prefix_length] if start is not None else None
+        end = end[:prefix_length] if end is not None else None
+        buckets = {}
+        for bucket, metric, low, high, total, count in self.local_store.query_rollups(
+                device_id, resolution, start, end, limit, newest=newest):
+            buckets.setdefault(bucket, {})[metric] = [low, high, total, count]
+        with self._lock:
+            for (pending_device, pending_resolution, bucket), stats in self._pending.items():
+                if pending_device != device_id or pending_resolution != resolution:
+                    continue
+                if (start is not None and bucket < start) or (end is not None and bucket > end):
+                    continue
+                merged = buckets.setdefault(bucket, {})
+                for metric, (low, high, total, count) in stats.items():
+                    current = merged.get(metric)
+                    merged[metric] = [low, high, total, count] if current is None else [
+                        min(current[0], low), max(current[1], high), current[2] + total, current[3] + count
+                    ]
+        return [
+            {"bucket": bucket, **{
+                metric: {"min": low, "max": high, "mean": total / count, "count": count}
+                for metric, (low, high, total, count) in stats.items()
+            }}
+            for bucket, stats in (sorted(buckets.items())[-limit:] if newest else sorted(buckets.items())[:limit])
+        ]
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self, timeout=10):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
 # ==========================
 # 4. MQTT Communicator
 # ==========================
 class MqttCommunicator:
-    def __init__(self, mqtt_broker, mqtt_port, username=None, password=None, use_tls=False):
-        self.client = mqtt.Client()
+    def __init__(self, mqtt_broker, mqtt_port, username=None, password=None, use_tls=False,
+                 shared_group=MQTT_SHARED_GROUP, client_id=None, topics=None):
+        self.shared_group = shared_group
+        # topics (re)souscrits à chaque connexion ; None => ceux de l'ingest, [] => publication seule
+        self.topics = self.ingest_topics() if topics is None else list(topics)
+        self._topics_lock = threading.Lock()
+        if shared_group:
+            # les abonnements partagés ($share/...) nécessitent MQTT v5 et un client_id distinct par instance
+            self.client = mqtt.Client(client_id=client_id or f"smart-plant-{INSTANCE_ID}", protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(client_id=client_id or "")
         self.broker = mqtt_broker
         self.port = mqtt_port
         self.username = username
@@ -182,16 +1153,43 @@ class MqttCommunicator:
         self.client.on_subscribe = self._on_subscribe
         self.client.on_message = None  # sera défini par set_on_message_callback
 
-    def _on_connect(self, client, userdata, flags, rc):
+    def subscription(self, topic):
+        # "$share/<groupe>/plant/+/telemetry" : chaque message n'est remis qu'à une instance du groupe
+        return f"$share/{self.shared_group}/{topic}" if self.shared_group else topic
+
+    def ingest_topics(self):
+        return [self.subscription(topic) for topic in filter(None, (MQTT_TELEMETRY_TOPIC_TEMPLATE,
+                                                                    MQTT_ACK_TOPIC_TEMPLATE))]
+
+    def set_topics(self, topics):
+        # bascule ingest <-> observateur sans reconnexion (élection de l'ingest)
+        with self._topics_lock:
+            previous, self.topics = self.topics, list(topics)
+            if not self.client.is_connected():
+                return  # _on_connect souscrira aux nouveaux topics
+            for topic in previous:
+                if topic not in self.topics:
+                    self.client.unsubscribe(topic)
+                    print(f"[MQTT] Désabonné de {topic}")
+            for topic in self.topics:
+                if topic not in previous:
+                    self.client.subscribe(topic)
+                    print(f"[MQTT] Souscrit à {topic}")
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        # properties : fourni uniquement en MQTT v5 (rc est alors un ReasonCodes, comparable à 0)
         if rc == 0:
             print("[MQTT] Connecté au broker MQTT.")
-            # S'abonner au topic telemetry wildcard
-            client.subscribe(MQTT_TELEMETRY_TOPIC_TEMPLATE)
-            print(f"[MQTT] Souscrit à {MQTT_TELEMETRY_TOPIC_TEMPLATE}")
+            with self._topics_lock:
+                for topic in self.topics:
+                    client.subscribe(topic)
+                    print(f"[MQTT] Souscrit à {topic}")
+            if not self.topics:
+                print("[MQTT] Aucun abonnement (publication seule).")
         else:
             print(f"[MQTT] Échec connexion MQTT, code: {rc}")
 
-    def _on_subscribe(self, client, userdata, mid, granted_qos):
+    def _on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
         print(f"[MQTT] Souscription réussie (mid={mid}, qos={granted_qos})")
 
     def connect(self):
@@ -216,11 +1214,72 @@ class MqttCommunicator:
 # ==========================
 # 5. Notification Service
 # ==========================
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+_push_id_state = {"last_ms": None, "random": []}
+_push_id_lock = threading.Lock()
+
+
+def generate_push_id():
+    # même format que les clés push() de Firebase (triées chronologiquement), sans aller-retour réseau
+    with _push_id_lock:
+        now_ms = int(time.time() * 1000)
+        rand = _push_id_state["random"]
+        if now_ms == _push_id_state["last_ms"]:
+            i = 11
+            while i >= 0 and rand[i] == 63:
+                rand[i] = 0
+                i -= 1
+            if i >= 0:
+                rand[i] += 1
+        else:
+            rand[:] = [random.randrange(64) for _ in range(12)]
+            _push_id_state["last_ms"] = now_ms
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now_ms % 64])
+            now_ms //= 64
+        return "".join(reversed(time_chars)) + "".join(PUSH_CHARS[r] for r in rand)
+
+
 class NotificationService:
-    def __init__(self):
+    def __init__(self, window=NOTIF_COALESCE_WINDOW, flush_interval=NOTIF_FLUSH_INTERVAL):
         self.ref = db.reference("/notifications")
+        self.window = window
+        self.flush_interval = flush_interval
+        # (plant_id, message) -> fenêtre ouverte {opened, first, last, count} ; count = répétitions retenues
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notification-flusher", daemon=True)
+
+    def start(self):
+        if self.window > 0:
+            self._thread.start()
+            atexit.register(self.stop)
+            print(f"[NOTIF] Regroupement activé (fenêtre {self.window}s).")
 
-    def push(self, plant_id, message):
+    def push(self, plant_id, message, coalesce=True):
+        if not coalesce or not self._thread.is_alive():
+            self._push_now(plant_id, message)
+            return
+        # première occurrence envoyée tout de suite, seules les répétitions dans la fenêtre sont regroupées
+        now = datetime.now().isoformat()
+        with self._lock:
+            entry = self._windows.get((plant_id, message))
+            if entry is None:
+                self._windows[(plant_id, message)] = {
+                    "opened": time.monotonic(), "first": None, "last": None, "count": 0
+                }
+            else:
+                entry["first"] = entry["first"] or now
+                entry["last"] = now
+                entry["count"] += 1
+        if entry is None:
+            self._push_now(plant_id, message)
+            return
+        NOTIFICATIONS_SUPPRESSED.inc()
+
+    def _push_now(self, plant_id, message):
         notif = {
             "plantId": plant_id,
             "message": message,
@@ -228,51 +1287,430 @@ class NotificationService:
             "seen": False
         }
         try:
-            notif_ref = self.ref.child(plant_id).push(notif)
+            with firebase_timer("push_notification"):
+                notif_ref = self.ref.child(plant_id).push(notif)
+            NOTIFICATIONS_EMITTED.labels(mode="immediate").inc()
             print(f"[NOTIF] {message} (ID = {notif_ref.key})")
         except Exception as e:
             print(f"[NOTIF] Erreur push notification: {e}")
 
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+        self.flush(force=True)
+
+    def flush(self, force=False):
+        # ferme les fenêtres expirées : une notification agrégée par fenêtre ayant eu des répétitions,
+        # en une seule écriture multi-path
+        deadline = time.monotonic() - self.window
+        with self._lock:
+            expired = [key for key, entry in self._windows.items() if force or entry["opened"] <= deadline]
+            closed = [(key, self._windows.pop(key)) for key in expired]
+        if not closed:
+            return
+        updates = {}
+        for (plant_id, message), entry in closed:
+            count = entry["count"]
+            if count == 0:
+                continue  # occurrence unique, déjà envoyée
+            updates[f"{plant_id}/{generate_push_id()}"] = {
+                "plantId": plant_id,
+                "message": f"{message} (répété x{count})",
+                "timestamp": entry["last"],
+                "firstTimestamp": entry["first"],
+                "lastTimestamp": entry["last"],
+                "count": count,
+                "seen": False
+            }
+        if not updates:
+            return
+        try:
+            with firebase_timer("flush_notifications"):
+                self.ref.update(updates)
+            NOTIFICATIONS_EMITTED.labels(mode="coalesced").inc(len(updates))
+            print(f"[NOTIF] {len(updates)} notification(s) regroupée(s) envoyée(s).")
+        except Exception as e:
+            print(f"[NOTIF] Erreur envoi notifications regroupées: {e}")
+
+    def stop(self, timeout=10):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+# ==========================
+# 5b. Command Dispatcher (partagé par l'ingest et l'API)
+# ==========================
+class CommandDispatcher:
+    SOURCE_MESSAGES = {
+        "manual": "Commande manuelle envoyée : {command}",
+        "auto": "Commande automatique envoyée ({command})",
+    }
+
+    def __init__(self, communicator: MqttCommunicator, db_manager: DatabaseManager,
+                 notif_service: NotificationService, workers=COMMAND_WORKERS, queue_size=COMMAND_QUEUE_SIZE):
+        self.communicator = communicator
+        self.db_manager = db_manager
+        self.notif_service = notif_service
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f"command-dispatcher-{i}", daemon=True)
+            for i, q in enumerate(self.queues)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        atexit.register(self.stop)
+        print(f"[Commands] Dispatcher démarré ({len(self._threads)} workers).")
+
+    def dispatch(self, plant_id, command, source="manual"):
+        # retour immédiat : le travail réseau est fait par les workers ; même plante => même worker (ordre conservé)
+        shard = zlib.crc32(str(plant_id).encode()) % len(self.queues)
+        try:
+            self.queues[shard].put_nowait((plant_id, command, source))
+            return True
+        except queue.Full:
+            COMMANDS_DISPATCHED.labels(source=source, result="dropped").inc()
+            print(f"[Commands] File pleine, commande '{command}' ignorée pour {plant_id}")
+            return False
+
+    def _run(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            self._execute(*item)
+
+    def _execute(self, plant_id, command, source):
+        try:
+            start = time.perf_counter()
+            self.db_manager.save_command(plant_id, command)
+            self.communicator.publish_command(plant_id, command)
+            notified = time.perf_counter()
+            STAGE_COMMAND.observe(notified - start)
+            # les commandes manuelles sont notifiées tout de suite, les automatiques sont regroupées
+            self.notif_service.push(plant_id, self.SOURCE_MESSAGES[source].format(command=command),
+                                    coalesce=source != "manual")
+            STAGE_NOTIFY.observe(time.perf_counter() - notified)
+            COMMANDS_DISPATCHED.labels(source=source, result="sent").inc()
+        except Exception as e:
+            COMMANDS_DISPATCHED.labels(source=source, result="failed").inc()
+            print(f"[Commands] Erreur envoi commande '{command}' pour {plant_id}: {e}")
+
+    def stop(self, timeout=10):
+        for q, thread in zip(self.queues, self._threads):
+            if thread.is_alive():
+                q.put(None)
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout)
+
+# ==========================
+# 6. Ingest worker pool (hors du thread réseau paho)
+# ==========================
+class IngestWorkerPool:
+    def __init__(self, handler, workers=INGEST_WORKERS, queue_size=INGEST_QUEUE_SIZE):
+        self.handler = handler
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f"ingest-worker-{i}", daemon=True)
+            for i, q in enumerate(self.queues)
+        ]
+        for i, q in enumerate(self.queues):
+            INGEST_QUEUE_DEPTH.labels(worker=str(i)).set_function(q.qsize)
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        atexit.register(self.stop)
+        print(f"[IngestPool] {len(self._threads)} workers démarrés.")
+
+    def _shard(self, topic):
+        # plant/<deviceId>/telemetry : une plante va toujours au même worker (ordre conservé)
+        parts = topic.split("/")
+        key = parts[1] if len(parts) > 2 else topic
+        return zlib.crc32(key.encode()) % len(self.queues)
+
+    def submit(self, client, userdata, msg):
+        # appelé dans le thread paho : ne doit jamais bloquer
+        try:
+            self.queues[self._shard(msg.topic)].put_nowait((time.monotonic(), client, userdata, msg))
+        except queue.Full:
+            INGEST_DROPPED.inc()
+            print(f"[IngestPool] File pleine, message ignoré sur {msg.topic}")
+
+    def backlog(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def _run(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            enqueued_at, client, userdata, msg = item
+            INGEST_QUEUE_WAIT_SECONDS.observe(time.monotonic() - enqueued_at)
+            start = time.perf_counter()
+            self.handler(client, userdata, msg)
+            INGEST_HANDLER_SECONDS.observe(time.perf_counter() - start)
+
+    def stop(self, timeout=10):
+        for q, thread in zip(self.queues, self._threads):
+            if thread.is_alive():
+                q.put(None)
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout)
+
 # ==========================
-# 6. Data Ingest Service
+# 6b. Data Ingest Service
 # ==========================
 class DataIngestService:
     def __init__(self, communicator: MqttCommunicator, db_manager: DatabaseManager,
-                 emotion_engine: EmotionEngine, decision_maker: DecisionMaker, notif_service: NotificationService):
+                 emotion_engine: EmotionEngine, decision_maker: DecisionMaker, notif_service: NotificationService,
+                 command_dispatcher: CommandDispatcher, write_buffer: ReadingWriteBuffer = None,
+                 state_cache: LatestStateCache = None, actuation_controller: ActuationController = None,
+                 telemetry_broker: TelemetryBroker = None, rollup_aggregator: RollupAggregator = None,
+                 workers=INGEST_WORKERS):
         self.communicator = communicator
         self.db_manager = db_manager
         self.emotion_engine = emotion_engine
         self.decision_maker = decision_maker
         self.notif_service = notif_service
-        self.communicator.set_on_message_callback(self.on_message_received)
+        self.command_dispatcher = command_dispatcher
+        self.write_buffer = write_buffer
+        self.state_cache = state_cache
+        self.actuation_controller = actuation_controller
+        self.telemetry_broker = telemetry_broker
+        self.rollup_aggregator = rollup_aggregator
+        self.device_label = BoundedLabel(INGEST_DEVICE_LABELS_MAX)
+        self.worker_pool = None
+        if workers > 0:
+            self.worker_pool = IngestWorkerPool(self.on_message_received, workers)
+            self.worker_pool.start()
+        self.attach()
+
+    def attach(self):
+        # (re)branche l'ingest sur les messages MQTT (après une élection)
+        if self.worker_pool is not None:
+            self.communicator.set_on_message_callback(self.worker_pool.submit)
+        else:
+            self.communicator.set_on_message_callback(self.on_message_received)
 
     def on_message_received(self, client, userdata, msg):
         try:
-            payload = msg.payload.decode()
-            print(f"[Ingest] Message reçu sur {msg.topic}: {payload}")
-            data_json = json.loads(payload)
-            sensor_data = SensorData(**data_json)
+            if MQTT_ACK_TOPIC_TEMPLATE and mqtt.topic_matches_sub(MQTT_ACK_TOPIC_TEMPLATE, msg.topic):
+                self.on_ack_received(msg)
+                return
+            sensor_data = self.parse_message(msg)
+            if sensor_data is None:
+                return
+            INGEST_MESSAGES.labels(device=self.device_label(sensor_data.device_id)).inc()
+            print(f"[Ingest] Message reçu sur {msg.topic}: {sensor_data.device_id} @ {sensor_data.timestamp}")
+            t0 = time.perf_counter()
             emotion = self.emotion_engine.determine_emotion(sensor_data)
+            t1 = time.perf_counter()
+            STAGE_EMOTION.observe(t1 - t0)
             command = self.decision_maker.decide_action(emotion)
+            if self.actuation_controller is not None:
+                # n'envoie la commande que si l'état de la plante change (hystérésis, cooldown, ack)
+                command = self.actuation_controller.decide(sensor_data, command)
+            t2 = time.perf_counter()
+            STAGE_DECISION.observe(t2 - t1)
             # Sauvegarde + notification
-            data_to_save = sensor_data.to_dict()
-            data_to_save['emotion'] = emotion
-            saved = self.db_manager.save_reading(sensor_data.device_id, data_to_save)
+            data_to_save = sensor_data.to_record(emotion)
+            if self.write_buffer is not None:
+                saved = self.write_buffer.enqueue(sensor_data.device_id, data_to_save)
+            else:
+                saved = self.db_manager.save_reading(sensor_data.device_id, data_to_save)
+            t3 = time.perf_counter()
+            STAGE_SAVE.observe(t3 - t2)
             if saved:
                 print(f"[Ingest] Lecture sauvegardée pour {sensor_data.device_id}")
+                if self.state_cache is not None:
+                    self.state_cache.put(sensor_data.device_id, data_to_save)
+                if self.telemetry_broker is not None:
+                    self.telemetry_broker.publish(sensor_data.device_id, data_to_save)
+                if self.rollup_aggregator is not None:
+                    self.rollup_aggregator.add(sensor_data.device_id, data_to_save)
+                STAGE_FANOUT.observe(time.perf_counter() - t3)
             if command:
-                # Envoie commande automatique via API (si service local)
-                self.send_auto_command_to_api(sensor_data.device_id, command)
-                self.notif_service.push(sensor_data.device_id, f"Commande automatique envoyée ({command})")
+                # Commande automatique : sauvegarde + MQTT + notification en arrière-plan
+                self.command_dispatcher.dispatch(sensor_data.device_id, command, source="auto")
         except Exception as e:
-            print(f"[Ingest] Erreur traitement message: {e}")
+            print(f"[Ingest] Erreur traitement message sur {msg.topic}: {e} (payload={msg.payload[:200]!r})")
+
+    def parse_message(self, msg):
+        # decode -> json -> SensorData, chaque étape mesurée ; None (+ compteur par raison) si rejet
+        t0 = time.perf_counter()
+        try:
+            text = msg.payload.decode("utf-8")
+            t1 = time.perf_counter()
+            STAGE_DECODE.observe(t1 - t0)
+            data = json.loads(text)
+            t2 = time.perf_counter()
+            STAGE_PARSE.observe(t2 - t1)
+            sensor_data = SensorData.from_dict(data)
+            STAGE_SENSORDATA.observe(time.perf_counter() - t2)
+            return sensor_data
+        except UnicodeDecodeError as e:
+            reason, error = "decode", e
+        except json.JSONDecodeError as e:
+            reason, error = "json", e
+        except InvalidReading as e:
+            reason, error = e.reason, e
+        INGEST_PARSE_ERRORS.labels(reason=reason).inc()
+        print(f"[Ingest] Message rejeté sur {msg.topic} ({reason}): {error} (payload={msg.payload[:200]!r})")
+        return None
+
+    def on_ack_received(self, msg):
+        # plant/<deviceId>/ack, payload = commande exécutée par l'ESP
+        device_id = msg.topic.split("/")[1]
+        command = msg.payload.decode().strip()
+        if self.actuation_controller is not None:
+            self.actuation_controller.acknowledge(device_id, command)
+        print(f"[Ingest] Ack reçu de {device_id}: {command}")
+
+# ==========================
+# 6c. Telemetry observer (processus sans ingest : flux SSE + cache d'état)
+# ==========================
+class TelemetryObserver:
+    def __init__(self, emotion_engine: EmotionEngine, state_cache: LatestStateCache = None,
+                 telemetry_broker: TelemetryBroker = None):
+        self.emotion_engine = emotion_engine
+        self.state_cache = state_cache
+        self.telemetry_broker = telemetry_broker
+
+    def on_message(self, client, userdata, msg):
+        # même enregistrement que l'ingest, mais rien n'est écrit ni décidé ici
+        if MQTT_ACK_TOPIC_TEMPLATE and mqtt.topic_matches_sub(MQTT_ACK_TOPIC_TEMPLATE, msg.topic):
+            return
+        try:
+            sensor_data = SensorData.from_payload(msg.payload)
+        except ValueError:
+            return  # rejet compté par l'ingest élu
+        record = sensor_data.to_record(self.emotion_engine.determine_emotion(sensor_data))
+        if self.state_cache is not None:
+            self.state_cache.put(sensor_data.device_id, record)
+        if self.telemetry_broker is not None:
+            self.telemetry_broker.publish(sensor_data.device_id, record)
+
+# ==========================
+# 6d. Leader election (un seul ingest actif parmi les processus)
+# ==========================
+class LeaderElection:
+    def __init__(self, backend=LEADER_ELECTION, on_elected=None, on_demoted=None, db_manager=None,
+                 lock_file=LEADER_LOCK_FILE, lease_ttl=LEADER_LEASE_TTL, retry_interval=LEADER_RETRY_INTERVAL):
+        if backend not in ("file", "firebase"):
+            raise ValueError(f"LEADER_ELECTION inconnu: {backend!r} (file ou firebase)")
+        if backend == "firebase" and db_manager is None:
+            raise ValueError("LEADER_ELECTION=firebase nécessite db_manager")
+        self.backend = backend
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.db_manager = db_manager
+        self.lock_file = lock_file
+        self.lease_ttl = lease_ttl
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._fd = None
+        self._lease_expires = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+        print(f"[Leader] Élection de l'ingest ({self.backend}) pour {INSTANCE_ID}.")
+
+    def _run(self):
+        while True:
+            try:
+                held = self._acquire_file() if self.backend == "file" else self._acquire_lease()
+            except Exception as e:
+                print(f"[Leader] Erreur élection: {e}")
+                held = False
+            if held != self.is_leader:
+                self._transition(held)
+            # bail : renouvelé au tiers de sa durée ; verrou : tenu tant que le processus vit
+            interval = self.lease_ttl / 3 if held and self.backend == "firebase" else self.retry_interval
+            if self._stop_event.wait(interval):
+                break
 
-    def send_auto_command_to_api(self, plant_id, command):
+    def _transition(self, held):
+        self.is_leader = held
+        INGEST_LEADER.set(1 if held else 0)
+        status = "élu pour l'ingest" if held else "n'est plus l'ingest"
+        print(f"[Leader] {INSTANCE_ID} {status}.")
+        callback = self.on_elected if held else self.on_demoted
+        if callback is not None:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[Leader] Erreur bascule de rôle: {e}")
+
+    def _acquire_file(self):
+        # flock : libéré par l'OS à la mort du processus, un autre worker le prend au tour suivant
+        # (un verrou par processus : ne pas utiliser gunicorn --preload)
+        import fcntl  # Unix uniquement
+
+        if self._fd is not None:
+            return True
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
         try:
-            url = f"http://localhost:5000/plants/{plant_id}/command"
-            requests.post(url, json={"command": command}, timeout=5)
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, INSTANCE_ID.encode())
+        self._fd = fd
+        return True
+
+    def _acquire_lease(self):
+        # bail {instance, expires} dans Firebase : pris s'il est libre ou expiré, renouvelé par son titulaire
+        now = time.time()
+
+        def claim(current):
+            if current and current.get("instance") != INSTANCE_ID and current.get("expires", 0) > now:
+                return current
+            return {"instance": INSTANCE_ID, "expires": now + self.lease_ttl}
+
+        try:
+            lease = self.db_manager.update_leader_lease(claim)
         except Exception as e:
-            print(f"[AUTO] Erreur appel API auto: {e}")
+            print(f"[Leader] Erreur renouvellement du bail: {e}")
+            # sans confirmation, on lâche l'ingest avant que le bail ne puisse passer à un autre
+            return self.is_leader and time.time() < self._lease_expires - self.lease_ttl / 3
+        if lease and lease.get("instance") == INSTANCE_ID:
+            self._lease_expires = lease["expires"]
+            return True
+        return False
+
+    def _release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # libère le flock
+            self._fd = None
+        elif self.backend == "firebase" and self.is_leader:
+            try:
+                self.db_manager.update_leader_lease(
+                    lambda current: dict(current, expires=0)
+                    if current and current.get("instance") == INSTANCE_ID else current
+                )
+            except Exception as e:
+                print(f"[Leader] Erreur libération du bail: {e}")
+
+    def stop(self, timeout=10):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        # libération explicite : reprise immédiate par un autre processus, sans attendre l'expiration
+        self._release()
+        if self.is_leader:
+            self._transition(False)
 
 # ==========================
 # 7. Firebase listeners helper (note)
@@ -292,12 +1730,19 @@ def setup_firebase_listeners(db_manager: DatabaseManager):
 # 8. API Service (Flask)
 # ==========================
 class APIService:
-    def __init__(self, communicator, db_manager, notif_service):
+    def __init__(self, communicator, db_manager, notif_service, command_dispatcher, state_cache=None,
+                 telemetry_broker=None, rollup_aggregator=None):
         self.app = Flask(__name__)
         CORS(self.app)  # autorise toutes les origines par défaut (pour debug local)
         self.communicator = communicator
         self.db_manager = db_manager
         self.notif_service = notif_service
+        self.command_dispatcher = command_dispatcher
+        self.state_cache = state_cache
+        self.telemetry_broker = telemetry_broker
+        self.rollup_aggregator = rollup_aggregator
+        # flux SSE simultanés sur le serveur threadé (asgi.py ne passe pas par là)
+        self._stream_slots = threading.BoundedSemaphore(STREAM_MAX_THREADED)
         self.metrics = PrometheusMetrics(self.app)
         self.metrics.info('app_info', 'Pot de Fleurs Émotionnel', version='1.0.0')
         self.setup_routes()
@@ -309,65 +1754,265 @@ class APIService:
 
         @self.app.route('/plants/<plant_id>/state', methods=['GET'])
         def get_plant_state(plant_id):
-            # sécurité désactivée pour debug local ; si besoin, réactive la vérif token
-            state = self.db_manager.get_latest_state(plant_id)
-            if state:
-                return jsonify(state)
-            return jsonify({"error": "Plante non trouvée"}), 404
+            payload, status = self.get_state(plant_id)
+            return jsonify(payload), status
+
+        @self.app.route('/plants/<plant_id>/stream', methods=['GET'])
+        def stream_plant_readings(plant_id):
+            # Server-Sent Events : chaque lecture traitée par l'ingest, sans lecture Firebase
+            if self.telemetry_broker is None:
+                return jsonify({"error": "Flux temps réel désactivé"}), 503
+            if not self._stream_slots.acquire(blocking=False):
+                return jsonify({"error": "Trop de flux ouverts, réessayez"}), 503, {"Retry-After": "30"}
+            subscription = self.telemetry_broker.subscribe(plant_id)
+            response = Response(self.sse_events(subscription), mimetype="text/event-stream",
+                                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+            # appelé à la fermeture de la réponse, même si le générateur n'a jamais démarré
+            response.call_on_close(lambda: self.telemetry_broker.unsubscribe(subscription))
+            response.call_on_close(self._stream_slots.release)
+            return response
 
         @self.app.route('/plants/<plant_id>/history', methods=['GET'])
         def get_plant_history(plant_id):
-            history = self.db_manager.get_all_readings(plant_id)
-            if history:
-                return jsonify(history)
-            return jsonify({"error": "Historique non trouvé"}), 404
+            payload, status = self.get_history(plant_id, request.args)
+            return jsonify(payload), status
+
+        @self.app.route('/plants/<plant_id>/rollups', methods=['GET'])
+        def get_plant_rollups(plant_id):
+            payload, status = self.get_rollups(plant_id, request.args)
+            return jsonify(payload), status
 
         @self.app.route('/plants/<plant_id>/command', methods=['POST'])
         def send_manual_command(plant_id):
-            data = request.get_json() or {}
-            command = data.get('command')
-            if not command:
-                return jsonify({"error": "La clé 'command' est requise"}), 400
-            # sauvegarde + envoi mqtt + notif
-            self.db_manager.save_command(plant_id, command)
-            self.communicator.publish_command(plant_id, command)
-            self.notif_service.push(plant_id, f"Commande manuelle envoyée : {command}")
-            return jsonify({"message": f"Commande '{command}' envoyée à {plant_id}"}), 200
+            payload, status = self.send_command(plant_id, request.get_json(silent=True))
+            return jsonify(payload), status
 
         @self.app.route('/admin/all-data', methods=['GET'])
         def get_entire_database():
-            try:
-                all_data = self.db_manager.db_root.get()
-                return jsonify(all_data)
-            except Exception as e:
-                return jsonify({"error": str(e)}), 500
+            # ?format=ndjson : export en flux plante par plante (&gzip=1, &device=a,b, &start=, &end=)
+            if request.args.get('format') == 'ndjson':
+                lines, headers = self.export_request(request.args)
+                return Response(lines, mimetype="application/x-ndjson", headers=headers)
+            payload, status = self.get_all_data()
+            return jsonify(payload), status
 
         @self.app.route('/cdn/<user_id>/files', methods=['GET'])
         def list_user_files(user_id):
-            try:
-                bucket = self.db_manager.bucket
-                if not bucket:
-                    return jsonify({"error": "Aucun bucket configuré"}), 500
-                prefix = f"{user_id}/"
-                blobs = bucket.list_blobs(prefix=prefix)
-                files = [{"name": b.name, "url": b.generate_signed_url(timedelta(hours=1))} for b in blobs]
-                return jsonify({"files": files})
-            except Exception as e:
-                print(f"[CDN] Erreur list_user_files: {e}")
-                return jsonify({"error": "Erreur lors de la récupération des fichiers"}), 500
+            payload, status = self.list_files(user_id)
+            return jsonify(payload), status
+
+        @self.app.route('/admin/profile', methods=['GET'])
+        def profile_process():
+            # ?seconds=10 &interval=0.01 &format=collapsed|json (Authorization: Bearer <ADMIN_TOKEN>)
+            payload, status = self.run_profile(request.args, request.headers.get('Authorization'))
+            if isinstance(payload, str):
+                return Response(payload, status=status, mimetype="text/plain")
+            return jsonify(payload), status
+
+        @self.app.route('/admin/tracemalloc', methods=['GET'])
+        def trace_process_allocations():
+            # ?seconds=10 &limit=25 &group_by=lineno|filename|traceback
+            payload, status = self.run_tracemalloc(request.args, request.headers.get('Authorization'))
+            return jsonify(payload), status
+
+    # Handlers partagés par les routes Flask et l'app ASGI (asgi.py) : renvoient (payload, status)
+    def cached_state(self, plant_id):
+        return self.state_cache.get(plant_id) if self.state_cache is not None else None
+
+    def get_state(self, plant_id):
+        # sécurité désactivée pour debug local ; si besoin, réactive la vérif token
+        state = self.cached_state(plant_id)
+        if state is None:
+            state = self.db_manager.get_latest_state(plant_id)
+            if state and self.state_cache is not None:
+                self.state_cache.put(plant_id, state)
+        if state:
+            return state, 200
+        return {"error": "Plante non trouvée"}, 404
+
+    def get_history(self, plant_id, args):
+        # ?start=&end= (clé "%Y%m%d_%H%M%S_%f", préfixe ou ms ; alias from/to) &limit= &cursor=
+        # sans start ni cursor : les `limit` lectures les plus récentes ; start=0 pour partir de la première
+        start = to_timestamp_key(args.get('start', args.get('from')))
+        end = to_timestamp_key(args.get('end', args.get('to')), upper=True)
+        limit = int_arg(args, 'limit', HISTORY_DEFAULT_LIMIT)
+        if limit <= 0:
+            return {"error": "'limit' doit être positif"}, 400
+        limit = min(limit, HISTORY_MAX_LIMIT)
+        try:
+            after = decode_cursor(args.get('cursor'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        history, next_key = self.db_manager.get_readings(plant_id, start, end, limit, after=after)
+        if history or after is not None:
+            return {"readings": history, "next_cursor": encode_cursor(next_key)}, 200
+        return {"error": "Historique non trouvé"}, 404
+
+    def get_rollups(self, plant_id, args):
+        # ?resolution=1m|1h|1d &start= &end= &limit= (nombre d'intervalles)
+        if self.rollup_aggregator is None:
+            return {"error": "Agrégats désactivés (base locale et ingest sur un seul hôte requis)"}, 503
+        resolution = args.get('resolution', '1h')
+        if resolution not in ROLLUP_RESOLUTIONS:
+            return {"error": f"'resolution' doit valoir {list(ROLLUP_RESOLUTIONS)}"}, 400
+        start = to_timestamp_key(args.get('start'))
+        end = to_timestamp_key(args.get('end'), upper=True)
+        limit = int_arg(args, 'limit', ROLLUP_DEFAULT_LIMIT)
+        if limit <= 0:
+            return {"error": "'limit' doit être positif"}, 400
+        buckets = self.rollup_aggregator.query(plant_id, resolution, start, end, limit)
+        return {"resolution": resolution, "buckets": buckets}, 200
+
+    def send_command(self, plant_id, data):
+        command = data.get('command') if isinstance(data, dict) else None
+        if not command:
+            return {"error": "La clé 'command' est requise"}, 400
+        # sauvegarde + envoi mqtt + notif (asynchrone)
+        if not self.command_dispatcher.dispatch(plant_id, command, source="manual"):
+            return {"error": "File de commandes pleine, réessayez"}, 503
+        return {"message": f"Commande '{command}' envoyée à {plant_id}"}, 200
+
+    def get_all_data(self):
+        try:
+            return self.db_manager.db_root.get(), 200
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+    def export_request(self, args):
+        # (générateur de lignes NDJSON, en-têtes) pour /admin/all-data?format=ndjson
+        devices = [d for d in args.get('device', '').split(',') if d] or None
+        start = to_timestamp_key(args.get('start'))
+        end = to_timestamp_key(args.get('end'), upper=True)
+        lines = self.export_ndjson(devices, start, end)
+        headers = {}
+        if args.get('gzip') == '1':
+            lines = gzip_stream(lines)
+            headers["Content-Encoding"] = "gzip"
+        return lines, headers
+
+    def check_admin(self, authorization):
+        # None si autorisé, sinon (payload, status) à renvoyer
+        if not ADMIN_TOKEN:
+            return {"error": "Profilage désactivé (ADMIN_TOKEN non défini)"}, 404
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+            return {"error": "Non autorisé"}, 401
+        return None
+
+    def profile_window(self, args):
+        try:
+            seconds = float(args.get('seconds', 10))
+        except (TypeError, ValueError):
+            seconds = 0
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            raise ValueError(f"'seconds' doit être compris entre 0 et {PROFILE_MAX_SECONDS:g}")
+        return seconds
+
+    def run_profile(self, args, authorization):
+        # bloque le thread appelant pendant `seconds` : échantillonne tous les autres threads
+        denied = self.check_admin(authorization)
+        if denied:
+            return denied
+        output = args.get('format', 'collapsed')
+        if output not in ("collapsed", "json"):
+            return {"error": "'format' doit valoir collapsed ou json"}, 400
+        try:
+            seconds = self.profile_window(args)
+            interval = min(max(float(args.get('interval', PROFILE_DEFAULT_INTERVAL)), 0.001), 1.0)
+            stacks, samples = profiler.sample_stacks(seconds, interval)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except profiler.ProfilerBusy as e:
+            return {"error": str(e)}, 409
+        print(f"[Profiler] {samples} échantillons sur {seconds:g}s.")
+        if output == "collapsed":
+            return profiler.collapsed(stacks), 200
+        return {"seconds": seconds, "samples": samples, "functions": profiler.top_functions(stacks)}, 200
+
+    def run_tracemalloc(self, args, authorization):
+        denied = self.check_admin(authorization)
+        if denied:
+            return denied
+        group_by = args.get('group_by', 'lineno')
+        if group_by not in ("lineno", "filename", "traceback"):
+            return {"error": "'group_by' doit valoir lineno, filename ou traceback"}, 400
+        try:
+            seconds = self.profile_window(args)
+            result = profiler.trace_allocations(seconds, int_arg(args, 'limit', 25), group_by,
+                                                frames=10 if group_by == "traceback" else 1)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except profiler.ProfilerBusy as e:
+            return {"error": str(e)}, 409
+        return dict(result, seconds=seconds), 200
+
+    def list_files(self, user_id):
+        try:
+            bucket = self.db_manager.bucket
+            if not bucket:
+                return {"error": "Aucun bucket configuré"}, 500
+            prefix = f"{user_id}/"
+            blobs = bucket.list_blobs(prefix=prefix)
+            files = [{"name": b.name, "url": b.generate_signed_url(timedelta(hours=1))} for b in blobs]
+            return {"files": files}, 200
+        except Exception as e:
+            print(f"[CDN] Erreur list_user_files: {e}")
+            return {"error": "Erreur lors de la récupération des fichiers"}, 500
+
+    def sse_events(self, subscription):
+        try:
+            yield "retry: 3000\n\n"
+            while not subscription.closed:
+                try:
+                    data = subscription.queue.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: reading\ndata: {data}\n\n"
+        finally:
+            self.telemetry_broker.unsubscribe(subscription)
+
+    def export_ndjson(self, devices=None, start=None, end=None):
+        # une ligne JSON par nœud ; le filtre temporel s'applique aux lectures
+        try:
+            for plant_id in devices or self.db_manager.list_plant_ids():
+                for child in self.db_manager.list_plant_children(plant_id):
+                    if child in PAGED_PLANT_CHILDREN:
+                        bounds = (start, end) if child == "readings" else (None, None)
+                        for page in self.db_manager.iter_child_pages(plant_id, child, *bounds):
+                            yield "".join(
+                                json.dumps({"deviceId": plant_id, "type": child, "key": key, "data": value},
+                                           ensure_ascii=False) + "\n"
+                                for key, value in page
+                            )
+                    else:
+                        value = self.db_manager.get_plant_child(plant_id, child)
+                        yield json.dumps({"deviceId": plant_id, "type": child, "data": value},
+                                         ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"[Export] Erreur export NDJSON: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
 
     def run(self, host="0.0.0.0", port=5000):
         self.app.run(host=host, port=port, debug=False, use_reloader=False)
 
 # ==========================
-# MAIN
+# 9. App factory (python main.py, gunicorn main:app, asgi.py)
 # ==========================
-if __name__ == "__main__":
-    print("🚀 Démarrage service...")
-
+def create_services(role=SERVICE_ROLE, election=LEADER_ELECTION):
+    # démarre les composants du rôle (ingest MQTT, tâches de fond), renvoie l'APIService prêt à servir
+    if role not in SERVICE_ROLES:
+        print(f"SERVICE_ROLE inconnu: {role!r} (attendu: {', '.join(SERVICE_ROLES)})")
+        raise SystemExit(1)
     # Init DB
+    local_store_path = LOCAL_STORE_PATH
+    if local_store_path and MQTT_SHARED_GROUP:
+        # abonnement partagé : chaque ingest ne reçoit qu'une part des lectures, miroir et agrégats seraient partiels
+        print(f"[MAIN] MQTT_SHARED_GROUP={MQTT_SHARED_GROUP} : base locale désactivée (historique lu dans Firebase)")
+        local_store_path = ""
     try:
-        db_manager = DatabaseManager(SERVICE_ACCOUNT_FILE)
+        local_store = LocalReadingStore(local_store_path) if local_store_path else None
+        db_manager = DatabaseManager(SERVICE_ACCOUNT_FILE, local_store=local_store)
     except Exception as e:
         print("Impossible d'initialiser DatabaseManager:", e)
         raise SystemExit(1)
@@ -376,6 +2021,7 @@ if __name__ == "__main__":
     emotion_engine = EmotionEngine()
     decision_maker = DecisionMaker()
     notif_service = NotificationService()
+    notif_service.start()
 
     # Configure MQTT TLS usage conditionnellement (port 8883 => TLS)
     use_tls = MQTT_PORT == 8883
@@ -384,11 +2030,105 @@ if __name__ == "__main__":
         mqtt_port=MQTT_PORT,
         username=MQTT_USERNAME,
         password=MQTT_PASSWORD,
-        use_tls=use_tls
+        use_tls=use_tls,
+        topics=[]  # abonnements posés par start_ingest() / l'observateur
     )
 
-    ingest_service = DataIngestService(mqtt_communicator, db_manager, emotion_engine, decision_maker, notif_service)
-    api_service = APIService(mqtt_communicator, db_manager, notif_service)
+    # commandes manuelles de l'API publiées par chaque processus, ingest ou non
+    command_dispatcher = CommandDispatcher(mqtt_communicator, db_manager, notif_service)
+    command_dispatcher.start()
+
+    state_cache = LatestStateCache()
+    telemetry_broker = TelemetryBroker()
+
+    # bail entre hôtes : la base locale de cet hôte ne voit que ses périodes de leader
+    local_per_host = election == "firebase"
+    # lecture seule hors ingest : les agrégats flushés sont lus dans la base locale
+    rollup_aggregator = None
+    if local_store is not None and not local_per_host:
+        rollup_aggregator = RollupAggregator(local_store)
+
+    api_service = APIService(mqtt_communicator, db_manager, notif_service, command_dispatcher,
+                             state_cache=state_cache, telemetry_broker=telemetry_broker,
+                             rollup_aggregator=rollup_aggregator)
+
+    observer = None
+    if role != "ingest" and API_TELEMETRY_OBSERVER:
+        observer = TelemetryObserver(emotion_engine, state_cache=state_cache, telemetry_broker=telemetry_broker)
+
+    ingest = {}  # composants construits à la première prise de l'ingest, réutilisés ensuite
+
+    def start_compactor():
+        # suit le rôle d'ingest : une seule compaction à la fois, arrêtée à la perte de l'élection
+        # (bail entre hôtes : COMPACTION_ARCHIVE_DIR doit être un stockage partagé)
+        from compaction import ReadingCompactor  # import ici : compaction.py importe main quand il est lancé seul
+
+        worker_pool = ingest["service"].worker_pool
+        compactor = ReadingCompactor(
+            db_manager,
+            busy_check=lambda: worker_pool is not None and worker_pool.backlog() > COMPACTION_BUSY_BACKLOG
+        )
+        compactor.start()
+        ingest["compactor"] = compactor
+
+    def stop_compactor():
+        compactor = ingest.pop("compactor", None)
+        if compactor is not None:
+            compactor.stop()
+
+    def start_ingest():
+        if local_per_host:
+            db_manager.set_local_reads(True, reset_coverage=True)
+        if ingest:
+            ingest["service"].attach()
+            if COMPACTION_ENABLED:
+                start_compactor()
+            mqtt_communicator.set_topics(mqtt_communicator.ingest_topics())
+            return
+        write_buffer = None
+        if WRITE_BUFFER_ENABLED:
+            write_buffer = ReadingWriteBuffer(db_manager)
+            write_buffer.start()
+
+        actuation_controller = None
+        if ACTUATION_ENABLED:
+            # plusieurs ingests simultanés ou bail entre hôtes : état des actionneurs arbitré dans Firebase
+            shared = MQTT_SHARED_GROUP or election == "firebase"
+            actuation_controller = ActuationController(shared_state=db_manager if shared else None)
+            actuation_controller.start()
+
+        if rollup_aggregator is not None:
+            rollup_aggregator.start()
+
+        ingest["service"] = DataIngestService(mqtt_communicator, db_manager, emotion_engine, decision_maker,
+                                              notif_service, command_dispatcher, write_buffer=write_buffer,
+                                              state_cache=state_cache, actuation_controller=actuation_controller,
+                                              telemetry_broker=telemetry_broker, rollup_aggregator=rollup_aggregator)
+
+        if COMPACTION_ENABLED:
+            start_compactor()
+            atexit.register(stop_compactor)
+        mqtt_communicator.set_topics(mqtt_communicator.ingest_topics())
+
+    def stop_ingest():
+        # ingest perdu (ou jamais obtenu) : télémétrie observée seulement, ou publication seule
+        if observer is not None:
+            mqtt_communicator.set_on_message_callback(observer.on_message)
+            mqtt_communicator.set_topics([MQTT_TELEMETRY_TOPIC_TEMPLATE])
+        else:
+            mqtt_communicator.set_on_message_callback(None)
+            mqtt_communicator.set_topics([])
+        if local_per_host:
+            # historique lu dans Firebase tant qu'un autre hôte ingère ; la couverture (fichier
+            # partagé par les workers de l'hôte) n'est effacée que par le processus qui ingérait
+            db_manager.set_local_reads(False, reset_coverage="service" in ingest)
+        # après la bascule MQTT : l'arrêt attend la fin du lot en cours
+        stop_compactor()
+
+    if role == "api" or election:
+        stop_ingest()
+    else:
+        start_ingest()
 
     # Connect MQTT et lancer loop
     try:
@@ -397,8 +2137,45 @@ if __name__ == "__main__":
     except Exception as e:
         print("[MAIN] Erreur connexion MQTT:", e)
 
+    if role != "api" and election:
+        # un seul processus ingère ; les autres reprennent l'ingest si le leader disparaît
+        leader_election = LeaderElection(election, on_elected=start_ingest, on_demoted=stop_ingest,
+                                         db_manager=db_manager)
+        leader_election.start()
+
     # Afficher plantes et activer listeners debug
     setup_firebase_listeners(db_manager)
+    return api_service
 
-    print("🌐 API accessible sur http://localhost:5000")
-    api_service.run()
+
+def create_app():
+    # application WSGI ; plusieurs workers gunicorn => LEADER_ELECTION=file (un seul ingest),
+    # SERVICE_ROLE=api (ingest dans un autre processus) ou MQTT_SHARED_GROUP (un ingest par worker)
+    return create_services().app
+
+
+def __getattr__(name):
+    # `main:app` (Procfile) : services démarrés au premier accès, pas à l'import (scripts, benchmarks)
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ==========================
+# MAIN
+# ==========================
+if __name__ == "__main__":
+    print(f"🚀 Démarrage service (rôle {SERVICE_ROLE})...")
+    api_service = create_services()
+
+    if SERVICE_ROLE == "ingest":
+        print("📡 Ingest seul, pas de serveur HTTP (Ctrl+C pour arrêter)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    else:
+        print("🌐 API accessible sur http://localhost:5000")
+        api_service.run()
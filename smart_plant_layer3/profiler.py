@@ -0,0 +1,108 @@
+"""
+Profilage à la demande du processus en cours (routes /admin/profile et /admin/tracemalloc).
+
+- sample_stacks : échantillonne la pile de tous les threads (boucle paho, workers
+  d'ingest, threads Flask...) via sys._current_frames() pendant N secondes.
+  Sortie "collapsed" (une ligne "thread;f1;f2;... count"), lisible par
+  flamegraph.pl, speedscope ou inferno.
+- trace_allocations : active tracemalloc le temps de la fenêtre et renvoie les
+  plus grosses allocations encore vivantes à la fin.
+
+Rien ne tourne hors d'une requête : aucun coût quand le profilage est inactif.
+Un seul profilage à la fois (ProfilerBusy sinon).
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+_busy = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    # fichier + ligne de définition : un nœud par fonction dans le flamegraph
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def sample_stacks(seconds, interval=0.01):
+    # renvoie (Counter {pile collapsed: nombre d'échantillons}, nombre d'échantillons)
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("un profilage est déjà en cours")
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}").replace(";", ","))
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(interval)
+        return stacks, samples
+    finally:
+        _busy.release()
+
+
+def collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def top_functions(stacks, limit=50):
+    # temps "self" (feuille de la pile) et "total" (présente dans la pile) par fonction
+    self_counts, total_counts = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]
+        if frames:
+            self_counts[frames[-1]] += count
+        for label in set(frames):
+            total_counts[label] += count
+    return [
+        {"function": label, "self": self_counts[label], "total": total}
+        for label, total in total_counts.most_common(limit)
+    ]
+
+
+def trace_allocations(seconds, limit=25, group_by="lineno", frames=1):
+    # allocations faites pendant la fenêtre et encore vivantes à la fin, triées par taille
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("un profilage est déjà en cours")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(max(frames, 1))
+        time.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _busy.release()
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    top = []
+    for stat in snapshot.statistics(group_by)[:limit]:
+        top.append({
+            "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        })
+    return {"traced_kb": round(traced / 1024, 1), "peak_kb": round(peak / 1024, 1), "top": top}
@@ -0,0 +1,77 @@
+"""
+Recalcule l'émotion des lectures stockées (après un changement de seuils)
+avec l'API vectorisée EmotionEngine.determine_emotions, page par page.
+
+Usage :
+    python relabel_history.py                      # toutes les plantes, simulation
+    python relabel_history.py Plant_01 --write     # réécrit les émotions modifiées
+    python relabel_history.py --start 20251001 --end 20251031
+"""
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+
+from main import (DatabaseManager, EmotionEngine, LocalReadingStore, SERVICE_ACCOUNT_FILE, EXPORT_PAGE_SIZE,
+                  LOCAL_STORE_PATH, to_timestamp_key)
+
+
+def relabel_plant(db_manager, engine, plant_id, start=None, end=None, write=False, page_size=EXPORT_PAGE_SIZE):
+    stats = Counter()
+    for page in db_manager.iter_child_pages(plant_id, "readings", start, end, page_size):
+        page = [(key, value) for key, value in page if isinstance(value, dict)]
+        if not page:
+            continue
+        columns = np.array(
+            [[value.get("soilMoisture", np.nan), value.get("temperature", np.nan), value.get("lightLevel", np.nan)]
+             for _, value in page],
+            dtype=np.float64
+        )
+        codes = engine.determine_emotions(columns[:, 0], columns[:, 1], columns[:, 2])
+        changed = {}
+        for (key, value), code in zip(page, codes):
+            emotion = EmotionEngine.EMOTIONS[code]
+            stats[emotion] += 1
+            if value.get("emotion") != emotion:
+                stats["_changed"] += 1
+                changed[key] = emotion
+        if write and changed:
+            db_manager.db_root.update({f"plants/{plant_id}/readings/{key}/emotion": emotion
+                                       for key, emotion in changed.items()})
+            # même correction dans le miroir local, sinon /history servi localement garde l'ancienne émotion
+            if db_manager.local_store is not None:
+                db_manager.local_store.update_field(plant_id, "emotion", changed)
+        stats["_total"] += len(page)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ré-étiquetage vectorisé de l'historique des plantes")
+    parser.add_argument("plants", nargs="*", help="identifiants des plantes (toutes par défaut)")
+    parser.add_argument("--start", help="borne basse (clé %%Y%%m%%d_%%H%%M%%S_%%f, préfixe ou ms)")
+    parser.add_argument("--end", help="borne haute incluse")
+    parser.add_argument("--write", action="store_true", help="écrit les émotions modifiées dans Firebase et la base locale")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    local_store = LocalReadingStore(LOCAL_STORE_PATH) if args.write and LOCAL_STORE_PATH else None
+    db_manager = DatabaseManager(SERVICE_ACCOUNT_FILE, local_store=local_store)
+    engine = EmotionEngine()
+    start = to_timestamp_key(args.start)
+    end = to_timestamp_key(args.end, upper=True)
+
+    t0 = time.perf_counter()
+    total = 0
+    for plant_id in args.plants or db_manager.list_plant_ids():
+        stats = relabel_plant(db_manager, engine, plant_id, start, end, args.write, args.page_size)
+        total += stats["_total"]
+        distribution = {e: stats[e] for e in EmotionEngine.EMOTIONS if stats[e]}
+        print(f"[Relabel] {plant_id}: {stats['_total']} lectures, {stats['_changed']} modifiées {distribution}")
+    elapsed = time.perf_counter() - t0
+    mode = "écrites" if args.write else "simulation (--write pour appliquer)"
+    print(f"[Relabel] {total} lectures en {elapsed:.1f}s — {mode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Vérifie l'ingest horizontal (abonnement partagé MQTT v5) contre un broker local
+supportant $share (mosquitto >= 2, EMQX, HiveMQ CE) :
+
+1. deux instances du groupe se répartissent la télémétrie, sans doublon ;
+2. une plante assoiffée dont les lectures arrivent sur les deux instances
+   ne reçoit qu'une commande WATER_PUMP (revendication partagée des actionneurs).
+
+Firebase et les notifications sont remplacés par les faux de bench_ingest.
+
+Usage : python test_shared_subscription.py [host:port]
+"""
+import json
+import sys
+import threading
+import time
+from collections import Counter
+
+import paho.mqtt.client as mqtt
+
+from bench_ingest import FakeDatabaseManager, FakeNotificationService
+from main import (MqttCommunicator, EmotionEngine, DecisionMaker, ActuationController, CommandDispatcher,
+                  DataIngestService)
+
+GROUP = "smart-plant-test"
+
+
+def publish_telemetry(publisher, device_id, soil, count, start_ms):
+    for i in range(count):
+        payload = json.dumps({"deviceId": device_id, "soilMoisture": soil, "temperature": 22,
+                              "lightLevel": 500, "humidity": 60, "timestamp": start_ms + i})
+        publisher.publish(f"plant/{device_id}/telemetry", payload, qos=1).wait_for_publish()
+
+
+def test_message_distribution(host, port, messages=200):
+    print("🔍 Répartition de la télémétrie entre deux instances...")
+    received = Counter()
+    lock = threading.Lock()
+    instances = []
+    for name in ("a", "b"):
+        communicator = MqttCommunicator(host, port, shared_group=GROUP, client_id=f"{GROUP}-{name}")
+
+        def on_message(client, userdata, msg, name=name):
+            with lock:
+                received[name] += 1
+
+        communicator.set_on_message_callback(on_message)
+        communicator.connect()
+        instances.append(communicator)
+
+    publisher = mqtt.Client(client_id=f"{GROUP}-publisher", protocol=mqtt.MQTTv5)
+    publisher.connect(host, port, 60)
+    publisher.loop_start()
+    time.sleep(1)  # laisser le temps aux souscriptions
+
+    start_ms = int(time.time() * 1000)
+    for d in range(10):
+        publish_telemetry(publisher, f"shared_{d:02d}", 50, messages // 10, start_ms)
+    time.sleep(2)
+    publisher.loop_stop()
+    for communicator in instances:
+        communicator.client.loop_stop()
+        communicator.client.disconnect()
+
+    total = sum(received.values())
+    print(f"   Reçus : {dict(received)} (total {total}/{messages})")
+    if total == messages and all(received[name] > 0 for name in ("a", "b")):
+        print("✅ Chaque message traité une seule fois, charge répartie.")
+        return True
+    print("❌ Doublons, pertes ou instance inactive.")
+    return False
+
+
+def test_single_command(host, port, readings=20):
+    print("\n🔍 Commande unique pour une plante servie par deux instances...")
+    db_manager = FakeDatabaseManager()  # tient lieu de Firebase, partagé par les deux instances
+    services = []
+    for name in ("a", "b"):
+        communicator = MqttCommunicator(host, port, shared_group=GROUP, client_id=f"{GROUP}-ingest-{name}")
+        dispatcher = CommandDispatcher(communicator, db_manager, FakeNotificationService())
+        dispatcher.start()
+        controller = ActuationController(state_file=None, shared_state=db_manager)
+        ingest = DataIngestService(communicator, db_manager, EmotionEngine(), DecisionMaker(),
+                                   FakeNotificationService(), dispatcher, actuation_controller=controller, workers=1)
+        communicator.connect()
+        services.append((communicator, dispatcher, ingest))
+
+    publisher = mqtt.Client(client_id=f"{GROUP}-publisher", protocol=mqtt.MQTTv5)
+    publisher.connect(host, port, 60)
+    publisher.loop_start()
+    time.sleep(1)
+
+    publish_telemetry(publisher, "shared_thirsty", 10, readings, int(time.time() * 1000))
+    deadline = time.time() + 10
+    while len(db_manager.saved_at) < readings and time.time() < deadline:
+        time.sleep(0.1)
+    time.sleep(1)  # laisser le dispatcher publier
+    publisher.loop_stop()
+    for communicator, dispatcher, ingest in services:
+        communicator.client.loop_stop()
+        communicator.client.disconnect()
+        ingest.worker_pool.stop()
+        dispatcher.stop()
+
+    commands = db_manager.commands["shared_thirsty"]
+    print(f"   Lectures sauvegardées : {len(db_manager.saved_at)}/{readings}, commandes : {commands}")
+    if len(db_manager.saved_at) == readings and commands == ["WATER_PUMP:3000"]:
+        print("✅ Une seule commande envoyée.")
+        return True
+    print("❌ Commande absente ou dupliquée.")
+    return False
+
+
+if __name__ == "__main__":
+    host, _, port = (sys.argv[1] if len(sys.argv) > 1 else "localhost:1883").partition(":")
+    ok = test_message_distribution(host, int(port or 1883))
+    ok = test_single_command(host, int(port or 1883)) and ok
+    sys.exit(0 if ok else 1)
@@ -1,12 +1,19 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 import firebase_admin
 from firebase_admin import credentials, db
 import numpy as np
 import json
 import os
 import joblib
+import atexit
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from tensorflow.keras.models import load_model
 
+from forecasting import SEQUENCE_LENGTH, FUTURE_STEPS, Forecaster, window_from_readings
+from inference_batcher import InferenceBatcher
+
 app = Flask(__name__)
 
 # =============================
@@ -22,13 +29,15 @@ xgb_model = joblib.load(os.path.join(BASE_PATH, "xgboost_emotion_model.pkl"))
 with open(os.path.join(BASE_PATH, "scaling_info.json"), "r") as f:
     scaling = json.load(f)
 
-X_min = scaling["X_min"]
-X_max = scaling["X_max"]
-emotion_map = scaling["emotion_map"]
-emotion_map_reverse = {v: k for k, v in emotion_map.items()}
+forecaster = Forecaster(lstm_model, xgb_model, scaling)
+# les requêtes /predict concurrentes partagent les mêmes appels aux modèles
+# thread lancé à la première prévision : pas dans le processus parent du reloader (debug=True)
+batcher = InferenceBatcher(forecaster)
+atexit.register(batcher.stop)
 
-FEATURES = ["temperature", "humidity", "lightLevel", "soilMoisture"]
-SEQUENCE_LENGTH = 5  # Réduit à 5 pour mieux gérer les données limitées
+PREDICT_MAX_STEPS = 24       # pas de prévision maximum par requête
+PREDICT_MAX_PLANTS = 500     # plantes maximum par requête multi-plantes
+fetch_executor = ThreadPoolExecutor(max_workers=16)  # lectures Firebase des fenêtres en parallèle
 
 # =============================
 #   INITIALISATION FIREBASE
@@ -38,17 +47,6 @@ firebase_admin.initialize_app(cred, {
     'databaseURL': 'https://smart-plant-free-default-rtdb.firebaseio.com/'
 })
 
-# =============================
-#   NORMALISATION
-# =============================
-def normalize(v, feature):
-    return (v - X_min[feature]) / (X_max[feature] - X_min[feature])
-
-def denormalize(v, feature):
-    """Dénormalise une valeur en clippant aux plages valides"""
-    denorm = v * (X_max[feature] - X_min[feature]) + X_min[feature]
-    return np.clip(denorm, X_min[feature], X_max[feature])
-
 # =============================
 #   ENDPOINT → LIRE LAYER 3
  
@@ -119,5 +117,123 @@ def get_predictions():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+# =============================
+#   ENDPOINT → PRÉDICTION À LA DEMANDE
+# =============================
+def fetch_tail(plant_id, after=None, limit=SEQUENCE_LENGTH):
+    """
+    Au plus `limit` dernières lectures de la plante, postérieures à la clé `after` si fournie
+    (clés horodatées => ordre chronologique), sans télécharger tout l'historique.
+    """
+    query = db.reference(f"/plants/{plant_id}/readings").order_by_key()
+    if after:
+        # start_at inclut la clé de départ : une lecture de plus, retirée ensuite
+        query = query.start_at(after)
+    readings = query.limit_to_last(limit + (1 if after else 0)).get() or {}
+    return dict([(key, reading) for key, reading in readings.items() if key != after][-limit:])
+
+def fetch_window(plant_id):
+    return window_from_readings(fetch_tail(plant_id).values())
+
+def steps_arg():
+    steps = request.args.get("steps", FUTURE_STEPS, type=int)
+    if not 1 <= steps <= PREDICT_MAX_STEPS:
+        raise ValueError(f"'steps' doit être compris entre 1 et {PREDICT_MAX_STEPS}")
+    return steps
+
+def predict_plants(plant_ids, steps):
+    """Prévisions pour plusieurs plantes : un appel LSTM par pas pour toutes les plantes"""
+    windows = dict(zip(plant_ids, fetch_executor.map(fetch_window, plant_ids)))
+    ready = [plant_id for plant_id in plant_ids if windows[plant_id] is not None]
+    skipped = [plant_id for plant_id in plant_ids if windows[plant_id] is None]
+    if not ready:
+        return [], skipped
+    values, emotions = batcher.forecast(np.stack([windows[plant_id] for plant_id in ready]), steps)
+    return forecaster.to_records(ready, values, emotions), skipped
+
+@app.route('/predict/<plant_id>', methods=['GET'])
+def predict_plant(plant_id):
+    """
+    Prévision des prochains pas (?steps=) et de l'émotion à partir des dernières lectures
+    """
+    try:
+        steps = steps_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        predictions, skipped = predict_plants([plant_id], steps)
+        if skipped:
+            return jsonify({"error": f"{plant_id}: moins de {SEQUENCE_LENGTH} lectures complètes"}), 404
+        return jsonify({
+            "success": True,
+            "deviceId": plant_id,
+            "predictions": predictions
+        }), 200
+    except queue.Full:
+        return jsonify({"error": "Serveur de prédiction saturé, réessayez"}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/predict', methods=['GET'])
+def predict_many():
+    """
+    Prévisions pour plusieurs plantes (?plant_ids=a,b,c), toutes les plantes si absent
+    """
+    try:
+        steps = steps_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        plant_ids = [p for p in request.args.get("plant_ids", "").split(",") if p]
+        if not plant_ids:
+            # shallow : uniquement les identifiants, pas les lectures
+            plant_ids = sorted(db.reference("/plants").get(shallow=True) or {})
+        if len(plant_ids) > PREDICT_MAX_PLANTS:
+            return jsonify({"error": f"{PREDICT_MAX_PLANTS} plantes maximum par requête"}), 400
+        predictions, skipped = predict_plants(plant_ids, steps)
+        return jsonify({
+            "success": True,
+            "total_predictions": len(predictions),
+            "predictions": predictions,
+            "skipped": skipped
+        }), 200
+    except queue.Full:
+        return jsonify({"error": "Serveur de prédiction saturé, réessayez"}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# =============================
+#   ENDPOINT → LECTURES RÉCENTES (cache de fenêtres de predict_realtime.py)
+# =============================
+@app.route('/plants_tail', methods=['POST'])
+def plants_tail():
+    """
+    Lectures postérieures au high-water mark de chaque plante, au plus `limit` par plante
+    Corps JSON : {"after": {"plant_id": "clé", ...}, "limit": 5}
+    """
+    body = request.get_json(silent=True) or {}
+    after = body.get("after") or {}
+    limit = body.get("limit", SEQUENCE_LENGTH)
+    if not isinstance(after, dict) or not isinstance(limit, int) or not 1 <= limit <= 1000:
+        return jsonify({"error": "'after' doit être un objet et 'limit' un entier entre 1 et 1000"}), 400
+    try:
+        # shallow : identifiants seulement ; les nouvelles plantes sont découvertes ici
+        plant_ids = sorted(db.reference("/plants").get(shallow=True) or {})
+        tails = fetch_executor.map(lambda plant_id: fetch_tail(plant_id, after.get(plant_id), limit), plant_ids)
+        return jsonify({
+            "success": True,
+            "total_plants": len(plant_ids),
+            "plants": {plant_id: tail for plant_id, tail in zip(plant_ids, tails) if tail}
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# =============================
+#   ENDPOINT → MÉTRIQUES PROMETHEUS
+# =============================
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5001, debug=True)
@@ -0,0 +1,80 @@
+"""
+Construction des séquences d'entraînement LSTM pour retrain_from_api.py.
+
+Les lectures sont regroupées par plante (deviceId) puis triées par timestamp :
+une fenêtre ne mélange jamais deux plantes. Les fenêtres sont des vues
+strided (sliding_window_view, sans copie) sur les valeurs de chaque plante,
+recopiées une seule fois dans un tenseur float32 (n, sequence_length, features).
+
+Au-delà de DATASET_MAX_IN_MEMORY_MB, le tenseur et ses labels sont écrits
+dans des fichiers .npy mappés en mémoire (np.memmap) au lieu de la RAM ;
+retrain_from_api.py les lit ensuite lot par lot (WindowBatches).
+"""
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+DATASET_MAX_IN_MEMORY_MB = float(os.environ.get("DATASET_MAX_IN_MEMORY_MB", 512))
+
+
+def _allocate(shape, dtype, out_dir, name):
+    if out_dir is None:
+        return np.empty(shape, dtype=dtype)
+    os.makedirs(out_dir, exist_ok=True)
+    return np.lib.format.open_memmap(os.path.join(out_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+
+def build_sequences(df, features, sequence_length, label_col=None, device_col="deviceId", time_col="timestamp",
+                    out_dir=None, max_in_memory_mb=DATASET_MAX_IN_MEMORY_MB):
+    """
+    df : lectures (features déjà normalisées), toutes plantes confondues, dans n'importe quel ordre.
+    Renvoie (X (n, sequence_length, features) float32, y_future (n, features) float32, labels (n,) ou None) :
+    pour chaque fenêtre, les valeurs et le label de la lecture qui la suit, dans la même plante.
+    Fichiers mappés dans out_dir si le tenseur dépasse max_in_memory_mb (out_dir requis pour cela).
+    """
+    sort_cols = [col for col in (device_col, time_col) if col in df.columns]
+    if sort_cols:
+        df = df.sort_values(sort_cols, kind="stable")
+    values = df[features].to_numpy(dtype=np.float32)
+    labels = df[label_col].to_numpy() if label_col is not None else None
+
+    # bornes [début, fin) de chaque plante dans le tableau trié
+    if device_col in df.columns:
+        devices = df[device_col].to_numpy()
+        starts = np.flatnonzero(np.r_[True, devices[1:] != devices[:-1]])
+    else:
+        starts = np.array([0])
+    ends = np.r_[starts[1:], len(values)]
+    # une fenêtre par lecture suivie d'une cible dans la même plante
+    counts = np.maximum(ends - starts - sequence_length, 0)
+    total = int(counts.sum())
+
+    n_features = len(features)
+    tensor_mb = total * sequence_length * n_features * 4 / (1024 * 1024)
+    target_dir = out_dir if out_dir is not None and tensor_mb > max_in_memory_mb else None
+    if target_dir is not None:
+        print(f" Séquences ({tensor_mb:.0f} Mo) écrites sur disque dans {target_dir}")
+    X = _allocate((total, sequence_length, n_features), np.float32, target_dir, "X_sequences")
+    y_future = _allocate((total, n_features), np.float32, target_dir, "y_future")
+    y_labels = _allocate((total,), labels.dtype, target_dir, "labels") if labels is not None else None
+
+    offset = 0
+    for start, end, count in zip(starts, ends, counts):
+        if count == 0:
+            continue
+        segment = values[start:end]
+        # vue (fenêtres, features, sequence_length) sans copie -> (fenêtres, sequence_length, features)
+        windows = sliding_window_view(segment, sequence_length, axis=0)[:count]
+        X[offset:offset + count] = windows.transpose(0, 2, 1)
+        y_future[offset:offset + count] = segment[sequence_length:]
+        if y_labels is not None:
+            y_labels[offset:offset + count] = labels[start + sequence_length:end]
+        offset += count
+
+    if target_dir is not None:
+        X.flush()
+        y_future.flush()
+        if y_labels is not None:
+            y_labels.flush()
+    return X, y_future, y_labels
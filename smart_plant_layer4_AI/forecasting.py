@@ -0,0 +1,104 @@
+"""
+Prévisions LSTM + émotion XGBoost, partagées par api.py (/predict) et predict_realtime.py.
+
+Tout est calculé par lots : un appel LSTM par pas de prévision pour toutes les
+plantes, un seul appel XGBoost pour toutes les plantes et tous les pas.
+Les fenêtres d'entrée sont les SEQUENCE_LENGTH dernières lectures brutes
+(non normalisées) de chaque plante, dans l'ordre chronologique.
+"""
+import numpy as np
+
+FEATURES = ["temperature", "humidity", "lightLevel", "soilMoisture"]
+SEQUENCE_LENGTH = 5       # Réduit à 5 au lieu de 10 (besoin moins de données)
+STEP_HOURS = 24
+FUTURE_STEPS = 2
+MODEL_NAME = "LSTM + Contraintes physiques"
+
+
+def window_from_readings(readings, sequence_length=SEQUENCE_LENGTH):
+    """
+    Construit la fenêtre (sequence_length, 4) à partir de lectures triées (plus ancienne en premier).
+    Les lectures incomplètes sont ignorées ; None s'il en reste moins de sequence_length.
+    """
+    rows = []
+    for reading in readings:
+        if not isinstance(reading, dict):
+            continue
+        try:
+            rows.append([float(reading[feature]) for feature in FEATURES])
+        except (KeyError, TypeError, ValueError):
+            continue
+    if len(rows) < sequence_length:
+        return None
+    return np.array(rows[-sequence_length:], dtype=np.float64)
+
+
+class Forecaster:
+    def __init__(self, lstm_model, xgb_model, scaling_info):
+        self.lstm_model = lstm_model
+        self.xgb_model = xgb_model
+        self.x_min = np.array([scaling_info["X_min"][feature] for feature in FEATURES], dtype=np.float64)
+        self.x_max = np.array([scaling_info["X_max"][feature] for feature in FEATURES], dtype=np.float64)
+        self.x_range = self.x_max - self.x_min
+        self.inv_emotion_map = {v: k for k, v in scaling_info["emotion_map"].items()}
+
+    # ---- Normalisation (sur la dernière dimension : les 4 features) ----
+    def normalize(self, values):
+        return (values - self.x_min) / self.x_range
+
+    def denormalize(self, values):
+        """Dénormalise et s'assure que les valeurs restent dans les limites valides"""
+        return np.clip(values * self.x_range + self.x_min, self.x_min, self.x_max)
+
+    def constrain(self, predictions, recent):
+        """
+        Force les prédictions (plantes, 4) à rester proches de la tendance réelle
+        des fenêtres brutes (plantes, sequence_length, 4) : au-delà de 2 écarts-types,
+        la prédiction est ramenée à 1.5 écart-type de la moyenne récente.
+        """
+        recent_mean = recent.mean(axis=1)
+        recent_std = recent.std(axis=1)
+        deviation = predictions - recent_mean
+        too_far = (recent_std > 0) & (np.abs(deviation) > 2 * recent_std)
+        predictions = np.where(too_far, recent_mean + np.sign(deviation) * 1.5 * recent_std, predictions)
+        return np.clip(predictions, self.x_min, self.x_max)
+
+    # ---- Modèles ----
+    def predict_lstm(self, windows):
+        return np.asarray(self.lstm_model.predict(windows, verbose=0))
+
+    def predict_emotions(self, rows):
+        return np.asarray(self.xgb_model.predict(rows))
+
+    def forecast(self, windows, steps=FUTURE_STEPS):
+        """
+        windows : (plantes, sequence_length, 4) valeurs brutes.
+        Renvoie (valeurs prévues (plantes, steps, 4), émotions [[str] * steps] par plante).
+        """
+        recent = np.asarray(windows, dtype=np.float64)
+        n_plants = recent.shape[0]
+        values = np.empty((n_plants, steps, len(FEATURES)))
+        if n_plants == 0:
+            return values, []
+        x_input = self.normalize(recent).astype(np.float32)
+        for step in range(steps):
+            predictions = self.constrain(self.denormalize(self.predict_lstm(x_input)), recent)
+            values[:, step] = predictions
+            # fenêtre glissante : la prévision devient la dernière entrée du pas suivant
+            x_input = np.concatenate([x_input[:, 1:], self.normalize(predictions)[:, None].astype(np.float32)],
+                                     axis=1)
+        emotion_idx = self.predict_emotions(values.reshape(-1, len(FEATURES))).reshape(n_plants, steps)
+        emotions = [[self.inv_emotion_map.get(int(idx), "inconnue") for idx in row] for row in emotion_idx]
+        return values, emotions
+
+    def to_records(self, device_ids, values, emotions, step_hours=STEP_HOURS):
+        """Même format que predictions_realtime.json (une entrée par plante et par pas)"""
+        records = []
+        for device_id, plant_values, plant_emotions in zip(device_ids, values.tolist(), emotions):
+            for step, (row, emotion) in enumerate(zip(plant_values, plant_emotions), start=1):
+                record = {"deviceId": device_id, "hours_ahead": step * step_hours}
+                record.update({feature: round(value, 2) for feature, value in zip(FEATURES, row)})
+                record["emotion_predicted"] = emotion
+                record["model"] = MODEL_NAME
+                records.append(record)
+        return records
@@ -0,0 +1,130 @@
+"""
+Regroupement des prévisions concurrentes (micro-batching) pour api.py.
+
+Chaque requête /predict dépose ses fenêtres dans une file et attend un Future.
+Un thread unique rassemble les requêtes arrivées pendant INFERENCE_MAX_WAIT_MS
+(ou jusqu'à INFERENCE_MAX_BATCH fenêtres), lance UNE prévision groupée
+(un appel LSTM par pas + un appel XGBoost) et rend à chacun sa tranche.
+Les modèles ne sont appelés que depuis ce thread.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from prometheus_client import Histogram
+
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", 5))  # attente max d'un lot
+INFERENCE_MAX_BATCH = int(os.environ.get("INFERENCE_MAX_BATCH", 256))  # fenêtres max par lot
+INFERENCE_QUEUE_SIZE = int(os.environ.get("INFERENCE_QUEUE_SIZE", 10000))  # requêtes en attente
+
+INFERENCE_BATCH_WINDOWS = Histogram(
+    "inference_batch_windows", "Fenêtres (plantes) par prévision groupée",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+)
+INFERENCE_BATCH_REQUESTS = Histogram(
+    "inference_batch_requests", "Requêtes regroupées par prévision groupée",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+INFERENCE_QUEUE_WAIT_SECONDS = Histogram(
+    "inference_queue_wait_seconds", "Attente d'une requête avant sa prévision groupée",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+INFERENCE_BATCH_SECONDS = Histogram(
+    "inference_batch_seconds", "Durée d'une prévision groupée (LSTM + XGBoost)"
+)
+
+
+class InferenceBatcher:
+    def __init__(self, forecaster, max_wait_ms=INFERENCE_MAX_WAIT_MS, max_batch=INFERENCE_MAX_BATCH,
+                 queue_size=INFERENCE_QUEUE_SIZE):
+        self.forecaster = forecaster
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            self._thread.start()
+        print(f"[Batcher] Regroupement des prévisions : {self.max_wait * 1000:g} ms, {self.max_batch} fenêtres max")
+
+    def submit(self, windows, steps):
+        """
+        windows : (plantes, sequence_length, 4) ; renvoie un Future de (valeurs, émotions)
+        comme Forecaster.forecast. queue.Full si la file est saturée.
+        """
+        if not self._started:
+            # démarrage paresseux : seul le processus qui sert des requêtes lance le thread
+            self.start()
+        future = Future()
+        self.queue.put_nowait((np.asarray(windows, dtype=np.float64), steps, future, time.perf_counter()))
+        return future
+
+    def forecast(self, windows, steps, timeout=30):
+        return self.submit(windows, steps).result(timeout)
+
+    def _collect(self):
+        # bloque jusqu'à la première requête, puis complète le lot jusqu'au délai ou à la taille max
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch, size = [first], len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)  # arrêt après ce lot
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.perf_counter()
+        for _, _, _, enqueued in batch:
+            INFERENCE_QUEUE_WAIT_SECONDS.observe(started - enqueued)
+        # prévision autorégressive : les k premiers pas ne dépendent pas du nombre total de pas
+        steps = max(item[1] for item in batch)
+        windows = np.concatenate([item[0] for item in batch])
+        INFERENCE_BATCH_WINDOWS.observe(len(windows))
+        INFERENCE_BATCH_REQUESTS.observe(len(batch))
+        try:
+            values, emotions = self.forecaster.forecast(windows, steps)
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            INFERENCE_BATCH_SECONDS.observe(time.perf_counter() - started)
+        offset = 0
+        for item_windows, item_steps, future, _ in batch:
+            end = offset + len(item_windows)
+            future.set_result((values[offset:end, :item_steps],
+                               [row[:item_steps] for row in emotions[offset:end]]))
+            offset = end
+
+    def stop(self, timeout=10):
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout)
@@ -1,15 +1,13 @@
-import io
 import json
-import numpy as np
 import tensorflow as tf
-import xgboost as xgb
-import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.preprocessing import MinMaxScaler
 import joblib
 import os
 import requests
 
+from forecasting import SEQUENCE_LENGTH, STEP_HOURS, FUTURE_STEPS, Forecaster
+from window_cache import WindowCache
+
 print("🚀 Prédiction en temps réel avec données limitées...\n")
 
 # ================================
@@ -25,25 +23,25 @@ model_xgb = joblib.load(model_xgb_path)
 print("✅ Modèles chargés avec succès.\n")
 
 # ================================
-# 📂 Chargement du dataset depuis l'API
+# 📂 Mise à jour des fenêtres depuis l'API (lectures postérieures au dernier passage)
 # ================================
-print("📂 Chargement du dataset depuis l'API...")
+window_cache_path = os.path.join(base_path, "window_cache.npz")
+window_cache = WindowCache.load(window_cache_path)
+print(f"📂 Mise à jour des fenêtres depuis l'API ({len(window_cache)} plantes en cache)...")
 try:
-    response = requests.get("http://localhost:5001/get_all_plants_list")
+    response = requests.post("http://localhost:5001/plants_tail",
+                             json={"after": window_cache.high_water_marks(), "limit": SEQUENCE_LENGTH})
     api_data = response.json()
-    
+
     if not api_data.get("success"):
         raise Exception("API request failed")
-    
-    records = []
-    for plant in api_data.get("plants", []):
-        readings = plant.get("data", {})
-        for timestamp, reading_data in readings.items():
-            if isinstance(reading_data, dict):
-                reading_data["deviceId"] = plant.get("plant_id")
-                records.append(reading_data)
-    
-    print(f"✅ {len(records)} enregistrements chargés depuis l'API.\n")
+
+    new_readings = 0
+    for plant_id, readings in api_data.get("plants", {}).items():
+        new_readings += window_cache.update(plant_id, readings)
+    window_cache.save(window_cache_path)
+
+    print(f"✅ {new_readings} nouveaux enregistrements chargés depuis l'API.\n")
 except Exception as e:
     print(f"❌ Erreur: {e}\n")
     exit(1)
@@ -55,58 +53,16 @@ scaling_info_path = os.path.join(base_path, "scaling_info.json")
 with open(scaling_info_path, "r", encoding="utf-8") as f:
     scaling_info = json.load(f)
 
-X_min = scaling_info["X_min"]
-X_max = scaling_info["X_max"]
-emotion_map = scaling_info["emotion_map"]
-inv_emotion_map = {v: k for k, v in emotion_map.items()}
-
-# ================================
-# 🧮 Fonctions utilitaires
-# ================================
-def normalize(value, feature):
-    return (value - X_min[feature]) / (X_max[feature] - X_min[feature])
-
-def denormalize(value, feature):
-    """Dénormalise et s'assure que la valeur reste dans les limites valides"""
-    denorm_value = value * (X_max[feature] - X_min[feature]) + X_min[feature]
-    denorm_value = np.clip(denorm_value, X_min[feature], X_max[feature])
-    return denorm_value
-
-def constrain_prediction(pred_value, recent_values, feature):
-    """
-    Force la prédiction à rester proche de la tendance réelle
-    Utile quand il y a peu de données
-    """
-    recent_mean = np.mean(recent_values)
-    recent_std = np.std(recent_values)
-    
-    # Si la prédiction s'écarte trop, la rapprocher
-    if recent_std > 0 and abs(pred_value - recent_mean) > 2 * recent_std:
-        # Ramener la prédiction vers la moyenne
-        pred_value = recent_mean + np.sign(pred_value - recent_mean) * 1.5 * recent_std
-    
-    # Clipping final
-    pred_value = np.clip(pred_value, X_min[feature], X_max[feature])
-    return pred_value
-
-def get_recent_trend(values):
-    """Calcule la tendance récente (augmentation ou diminution)"""
-    if len(values) < 2:
-        return 0
-    return np.mean(np.diff(values[-3:]))  # Tendance des 3 derniers points
+# normalisation, contraintes de tendance et modèles : calculés par lots pour toutes les plantes
+forecaster = Forecaster(model_lstm, model_xgb, scaling_info)
 
 # ================================
 # 🌿 Extraction des plantes
 # ================================
-plant_ids = sorted(list(set([r["deviceId"] for r in records])))
+plant_ids = sorted(window_cache.device_ids)
 print(f"🌿 Plantes détectées ({len(plant_ids)}) : {plant_ids}\n")
 
-# ================================
-# ⏱️ Paramètres de prédiction ADAPTÉ AUX DONNÉES LIMITÉES
-# ================================
-SEQUENCE_LENGTH = 5       # Réduit à 5 au lieu de 10 (besoin moins de données)
-STEP_HOURS = 24
-FUTURE_STEPS = 2
+# SEQUENCE_LENGTH, STEP_HOURS, FUTURE_STEPS : paramètres adaptés aux données limitées (forecasting.py)
 
 # ================================
 # 📁 Dossier de sauvegarde
@@ -114,97 +70,37 @@ FUTURE_STEPS = 2
 output_dir = os.path.join(base_path, "predictions_graphs")
 os.makedirs(output_dir, exist_ok=True)
 
-predictions_json = []
-
 # ================================
 # 🔮 Prédiction en temps réel
 # ================================
+# Fenêtres des plantes éligibles : derniers SEQUENCE_LENGTH enregistrements, lus dans le cache
 for plant_id in plant_ids:
-    plant_data = [r for r in records if r["deviceId"] == plant_id]
-    df = pd.DataFrame(plant_data)
-
-    if len(df) < SEQUENCE_LENGTH:
-        print(f"⚠️ {plant_id} ignorée ({len(df)} données < {SEQUENCE_LENGTH} requises)\n")
-        continue
+    if window_cache.count(plant_id) < SEQUENCE_LENGTH:
+        print(f"⚠️ {plant_id} ignorée ({window_cache.count(plant_id)} données < {SEQUENCE_LENGTH} requises)\n")
+ready_ids, windows = window_cache.windows(plant_ids)
 
-    df = df.sort_values("timestamp")
-
-    # Derniers SEQUENCE_LENGTH enregistrements
-    recent_data = df.tail(SEQUENCE_LENGTH)[["temperature", "humidity", "lightLevel", "soilMoisture"]].values
-    recent_denorm = recent_data.copy()  # Garder les valeurs dénormalisées pour les contraintes
-
-    # Normalisation
-    for i, feat in enumerate(["temperature", "humidity", "lightLevel", "soilMoisture"]):
-        recent_data[:, i] = normalize(recent_data[:, i], feat)
-
-    future_hours = []
-    temp_futures, hum_futures, light_futures, soil_futures, emo_futures = [], [], [], [], []
+# Un appel LSTM par pas pour toutes les plantes, un appel XGBoost pour tous les pas
+values, emotions = forecaster.forecast(windows, FUTURE_STEPS)
+predictions_json = forecaster.to_records(ready_ids, values, emotions)
+future_hours = [step * STEP_HOURS for step in range(1, FUTURE_STEPS + 1)]
 
+for plant_id, plant_values, plant_emotions in zip(ready_ids, values, emotions):
     print(f"🪴 {plant_id} — Prédictions temps réel :\n")
-
-    X_input = np.expand_dims(recent_data, axis=0)
-
-    for step in range(1, FUTURE_STEPS + 1):
-        # Prédiction LSTM
-        pred_future = model_lstm.predict(X_input, verbose=0)
-        temp_f, hum_f, light_f, soil_f = pred_future[0]
-
-        # Dénormalisation
-        temp_f = denormalize(temp_f, "temperature")
-        hum_f = denormalize(hum_f, "humidity")
-        light_f = denormalize(light_f, "lightLevel")
-        soil_f = denormalize(soil_f, "soilMoisture")
-
-        # ✅ CONTRAINTES: Forcer à rester proche de la tendance
-        temp_f = constrain_prediction(temp_f, recent_denorm[:, 0], "temperature")
-        hum_f = constrain_prediction(hum_f, recent_denorm[:, 1], "humidity")
-        light_f = constrain_prediction(light_f, recent_denorm[:, 2], "lightLevel")
-        soil_f = constrain_prediction(soil_f, recent_denorm[:, 3], "soilMoisture")
-
-        # Prédiction émotionnelle
-        xgb_input = np.array([[temp_f, hum_f, light_f, soil_f]])
-        pred_emotion_idx = model_xgb.predict(xgb_input)[0]
-        pred_emotion = inv_emotion_map.get(int(pred_emotion_idx), "inconnue")
-
-        print(f"   ⏳ Dans ~{step * STEP_HOURS} heures :")
+    for hours, (temp_f, hum_f, light_f, soil_f), pred_emotion in zip(future_hours, plant_values, plant_emotions):
+        print(f"   ⏳ Dans ~{hours} heures :")
         print(f"      🌡️ Température: {temp_f:.2f} °C")
         print(f"      💧 Humidité: {hum_f:.2f} %")
         print(f"      ☀️ Lumière: {light_f:.2f} lux")
         print(f"      🌿 Humidité sol: {soil_f:.2f} %")
         print(f"      🌱 Emotion: {pred_emotion}\n")
 
-        predictions_json.append({
-            "deviceId": plant_id,
-            "hours_ahead": step * STEP_HOURS,
-            "temperature": round(temp_f, 2),
-            "humidity": round(hum_f, 2),
-            "lightLevel": round(light_f, 2),
-            "soilMoisture": round(soil_f, 2),
-            "emotion_predicted": pred_emotion,
-            "model": "LSTM + Contraintes physiques"
-        })
-
-        future_hours.append(step * STEP_HOURS)
-        temp_futures.append(temp_f)
-        hum_futures.append(hum_f)
-        light_futures.append(light_f)
-        soil_futures.append(soil_f)
-        emo_futures.append(pred_emotion)
-
-        # Mise à jour pour prédiction suivante
-        new_row = np.array([[normalize(temp_f, "temperature"),
-                             normalize(hum_f, "humidity"),
-                             normalize(light_f, "lightLevel"),
-                             normalize(soil_f, "soilMoisture")]])
-        X_input = np.concatenate([X_input[:, 1:, :], np.expand_dims(new_row, axis=1)], axis=1)
-
     # ================================
     # 📈 Graphiques
     # ================================
     plt.figure(figsize=(10, 6))
-    plt.plot(future_hours, temp_futures, marker='o', linewidth=2, label="Température (°C)", color='red')
-    plt.plot(future_hours, hum_futures, marker='s', linewidth=2, label="Humidité (%)", color='blue')
-    plt.plot(future_hours, soil_futures, marker='^', linewidth=2, label="Humidité sol (%)", color='green')
+    plt.plot(future_hours, plant_values[:, 0], marker='o', linewidth=2, label="Température (°C)", color='red')
+    plt.plot(future_hours, plant_values[:, 1], marker='s', linewidth=2, label="Humidité (%)", color='blue')
+    plt.plot(future_hours, plant_values[:, 3], marker='^', linewidth=2, label="Humidité sol (%)", color='green')
     plt.title(f"Prédictions temps réel - {plant_id} (Seq={SEQUENCE_LENGTH})")
     plt.xlabel("Heures dans le futur")
     plt.ylabel("Valeurs")
@@ -7,12 +7,47 @@ import pandas as pd
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import LSTM, Dense, Input
 from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.utils import Sequence
 from sklearn.model_selection import train_test_split
 import xgboost as xgb
 import joblib
 import os
 import requests
 
+from dataset_builder import build_sequences
+
+
+class WindowBatches(Sequence):
+    """
+    Lots de fenêtres lus à la demande dans X (tableau ou np.memmap de build_sequences) :
+    fit/predict ne chargent jamais le tenseur entier en RAM.
+    """
+    def __init__(self, X, y=None, batch_size=4, shuffle=False, seed=42):
+        super().__init__()
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.order = np.arange(len(X))
+        if shuffle:
+            self.rng.shuffle(self.order)
+
+    def __len__(self):
+        return -(-len(self.X) // self.batch_size)
+
+    def __getitem__(self, index):
+        # indices triés dans le lot : lectures dans l'ordre du fichier mappé
+        rows = np.sort(self.order[index * self.batch_size:(index + 1) * self.batch_size])
+        if self.y is None:
+            return self.X[rows]
+        return self.X[rows], self.y[rows]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.order)
+
+
 print(" Réentraînement du modèle avec données API (temps réel)...\n")
 
 # ================================
@@ -30,7 +65,11 @@ try:
     all_readings = []
     for plant in api_data.get("plants", []):
         readings = plant.get("data", {})
-        all_readings.extend(readings.values())
+        for reading in readings.values():
+            if isinstance(reading, dict):
+                # plante d'origine : les séquences ne doivent pas mélanger deux plantes
+                reading.setdefault("deviceId", plant.get("plant_id"))
+                all_readings.append(reading)
     
     print(f" {len(all_readings)} enregistrements chargés depuis l'API.\n")
 except Exception as e:
@@ -66,7 +105,8 @@ print(f" Distribution:\n{df[label_col].value_counts()}\n")
 
 # Normalisation
 X_min, X_max = df[features].min(), df[features].max()
-df_norm = (df[features] - X_min) / (X_max - X_min)
+df_norm = df.copy()
+df_norm[features] = (df[features] - X_min) / (X_max - X_min)
 
 print(f" Min/Max détectés:")
 for feat in features:
@@ -79,15 +119,11 @@ print()
 sequence_length = min(5, len(df) // 2)  # Adapté à la taille des données
 print(f" Séquence LSTM: {sequence_length} enregistrements\n")
 
-X_sequences, y_future = [], []
-
-for i in range(len(df_norm) - sequence_length):
-    seq = df_norm.iloc[i:i + sequence_length].values
-    next_values = df_norm.iloc[i + sequence_length].values
-    X_sequences.append(seq)
-    y_future.append(next_values)
-
-X_sequences, y_future = np.array(X_sequences), np.array(y_future)
+# Par plante, triées par timestamp ; float32, sur disque (memmap) si le jeu dépasse la RAM allouée
+X_sequences, y_future, y_emotions = build_sequences(
+    df_norm, features, sequence_length, label_col="emotion_encoded",
+    out_dir=os.path.join(os.path.dirname(__file__), "dataset_cache")
+)
 
 if len(X_sequences) < 5:
     print(f"⚠️ ERREUR: Seulement {len(X_sequences)} séquences pour entraînement!")
@@ -116,20 +152,19 @@ model_lstm = Sequential([
 model_lstm.compile(optimizer=Adam(learning_rate=0.001), loss='mse')
 
 print(" Entraînement du modèle LSTM...")
-model_lstm.fit(X_sequences, y_future, epochs=50, batch_size=4, verbose=0)
+model_lstm.fit(WindowBatches(X_sequences, y_future, batch_size=4, shuffle=True), epochs=50, verbose=0)
 print("Entraînement du LSTM terminé.\n")
 
 # ================================
 # 🔄 Prédictions pour XGBoost
 # ================================
 print(" Génération des prédictions LSTM...")
-predicted_future = model_lstm.predict(X_sequences, verbose=0)
+predicted_future = model_lstm.predict(WindowBatches(X_sequences, batch_size=256), verbose=0)
 print(" Prédictions générées.\n")
 
 # ================================
 #  Modèle XGBoost
 # ================================
-y_emotions = df["emotion_encoded"].iloc[sequence_length:].values
 X_train, X_test, y_train, y_test = train_test_split(
     predicted_future, y_emotions, test_size=0.2, random_state=42
 )
@@ -0,0 +1,135 @@
+"""
+Cache persistant des dernières lectures de chaque plante pour predict_realtime.py.
+
+Par plante : un tampon circulaire des SEQUENCE_LENGTH dernières lectures
+(valeurs brutes, la normalisation est refaite au moment de la prévision)
+et la clé Firebase de la plus récente (high-water mark). Chaque exécution
+ne demande que les lectures postérieures à cette clé (POST /plants_tail de
+api.py), au plus SEQUENCE_LENGTH par plante, au lieu de tout l'historique.
+
+Snapshot compact sur disque (.npz, float32) : plantes, tampons, clés.
+"""
+import os
+
+import numpy as np
+
+from forecasting import FEATURES, SEQUENCE_LENGTH
+
+
+class WindowCache:
+    def __init__(self, sequence_length=SEQUENCE_LENGTH, capacity=64):
+        self.sequence_length = sequence_length
+        self.index = {}       # device_id -> ligne
+        self.device_ids = []  # ligne -> device_id
+        self.values = np.zeros((capacity, sequence_length, len(FEATURES)), dtype=np.float32)
+        self.counts = np.zeros(capacity, dtype=np.int32)  # lectures présentes (<= sequence_length)
+        self.heads = np.zeros(capacity, dtype=np.int32)   # prochaine position d'écriture
+        self.last_keys = []   # ligne -> clé de la lecture la plus récente ("" si aucune)
+
+    def __len__(self):
+        return len(self.device_ids)
+
+    def _row(self, device_id):
+        row = self.index.get(device_id)
+        if row is not None:
+            return row
+        row = len(self.device_ids)
+        if row == len(self.counts):
+            # capacité doublée : une copie amortie par plante ajoutée
+            grow = len(self.counts)
+            self.values = np.concatenate([self.values, np.zeros_like(self.values[:grow])])
+            self.counts = np.concatenate([self.counts, np.zeros(grow, dtype=np.int32)])
+            self.heads = np.concatenate([self.heads, np.zeros(grow, dtype=np.int32)])
+        self.index[device_id] = row
+        self.device_ids.append(device_id)
+        self.last_keys.append("")
+        return row
+
+    def high_water_marks(self):
+        return {device_id: key for device_id, key in zip(self.device_ids, self.last_keys) if key}
+
+    def update(self, device_id, readings):
+        """
+        readings : {clé Firebase: lecture}. Les clés déjà vues sont ignorées ;
+        les lectures incomplètes font avancer la clé sans entrer dans la fenêtre.
+        Renvoie le nombre de lectures ajoutées.
+        """
+        row = self._row(device_id)
+        added = 0
+        for key in sorted(readings):
+            if key <= self.last_keys[row]:
+                continue
+            self.last_keys[row] = key
+            reading = readings[key]
+            try:
+                values = [float(reading[feature]) for feature in FEATURES]
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.values[row, self.heads[row]] = values
+            self.heads[row] = (self.heads[row] + 1) % self.sequence_length
+            self.counts[row] = min(self.counts[row] + 1, self.sequence_length)
+            added += 1
+        return added
+
+    def count(self, device_id):
+        row = self.index.get(device_id)
+        return 0 if row is None else int(self.counts[row])
+
+    def windows(self, device_ids=None):
+        """
+        Fenêtres complètes, plus ancienne lecture en premier : (ids, tableau (plantes, sequence_length, 4)).
+        O(plantes x sequence_length), sans boucle Python sur les lectures.
+        """
+        if device_ids is None:
+            device_ids = self.device_ids
+        rows = np.array([self.index[d] for d in device_ids if d in self.index], dtype=np.int64)
+        rows = rows[self.counts[rows] == self.sequence_length]
+        # la position `head` contient la plus ancienne lecture d'un tampon plein
+        positions = (self.heads[rows, None] + np.arange(self.sequence_length)) % self.sequence_length
+        windows = self.values[rows[:, None], positions].astype(np.float64)
+        return [self.device_ids[row] for row in rows], windows
+
+    # ---- Snapshot ----
+    def save(self, path):
+        n = len(self.device_ids)
+        tmp_path = f"{path}.tmp"
+        # écriture dans un fichier ouvert : np.savez n'ajoute pas ".npz" au nom temporaire
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                device_ids=np.array(self.device_ids, dtype=str),
+                last_keys=np.array(self.last_keys, dtype=str),
+                values=self.values[:n],
+                counts=self.counts[:n],
+                heads=self.heads[:n],
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, sequence_length=SEQUENCE_LENGTH):
+        """Cache du snapshot, ou cache vide si absent, illisible ou d'une autre SEQUENCE_LENGTH"""
+        cache = cls(sequence_length)
+        if not os.path.exists(path):
+            return cache
+        try:
+            with np.load(path) as snapshot:
+                values = snapshot["values"]
+                if values.shape[1:] != cache.values.shape[1:]:
+                    print(f"⚠️ Snapshot {path} ignoré (fenêtre {values.shape[1]} != {sequence_length})")
+                    return cache
+                n = len(values)
+                cache.values = np.zeros((max(n, 64),) + values.shape[1:], dtype=np.float32)
+                cache.values[:n] = values
+                cache.counts = np.zeros(len(cache.values), dtype=np.int32)
+                cache.counts[:n] = snapshot["counts"]
+                cache.heads = np.zeros(len(cache.values), dtype=np.int32)
+                cache.heads[:n] = snapshot["heads"]
+                cache.device_ids = snapshot["device_ids"].tolist()
+                cache.last_keys = snapshot["last_keys"].tolist()
+                cache.index = {device_id: row for row, device_id in enumerate(cache.device_ids)}
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ Snapshot {path} illisible ({e}), reconstruction complète")
+            return cls(sequence_length)
+        return cache